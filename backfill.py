@@ -0,0 +1,192 @@
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from db import partitions
+from db.connector import DB_CONFIG, NEWS_CHANNEL
+import dbnews
+import prefilter
+from data_refactor import enrich_news
+from detect_tickers import detect_tickers
+
+from utils.ticker_map import ticker_lookup
+ticker_list = list(ticker_lookup.values())
+
+BATCH_SIZE = 64    # строк архива на одну пачку: одна пачка = один вызов модели и одна транзакция
+GPT_WORKERS = 8    # параллельных запросов к GPT для сырых статей
+
+# Массовая загрузка истории из JSONL-архива.
+# Каждая строка — либо сырая статья {"text": ...},
+# либо уже обогащённая запись {"text"|"compressed_message", "tickers", "polarity", "intensity"}.
+# Необязательное поле "published_time" (ISO 8601) кладёт новость в секцию её недели.
+#
+#   python backfill.py archive.jsonl                 # продолжит с контрольной точки, если она есть
+#   python backfill.py archive.jsonl --restart       # начать файл заново
+#
+# Файл читается потоково; после каждой записанной пачки в <archive>.ckpt
+# сохраняется смещение, так что прерванную загрузку можно продолжить.
+
+
+def is_enriched(record: dict) -> bool:
+    return "polarity" in record and "intensity" in record
+
+
+def enrich_record(record: dict) -> dict | None:
+    """Приводит строку архива к формату enrich_news; сырые статьи идут через GPT."""
+    if is_enriched(record):
+        text = record.get("compressed_message") or record.get("text")
+        if not text:
+            return None
+        tickers = record.get("tickers") or detect_tickers(text, ticker_lookup, ticker_list)
+        return {
+            "tickers": sorted(set(tickers)),
+            "text": text,
+            "polarity": record["polarity"],
+            "intensity": int(record["intensity"]),
+            "published_time": record.get("published_time"),
+        }
+
+    raw = record.get("text") or record.get("raw")
+    if not raw:
+        return None
+    tickers = detect_tickers(raw, ticker_lookup, ticker_list)
+    enriched = enrich_news(raw, tickers, ticker_lookup, ticker_list)
+    if enriched is not None:
+        enriched["published_time"] = record.get("published_time")
+    return enriched
+
+
+def enrich_safely(entry: tuple[int, dict]) -> dict | None:
+    """enrich_record, который не роняет загрузку: ошибка одной статьи — пропуск строки."""
+    line_offset, record = entry
+    try:
+        return enrich_record(record)
+    except Exception:
+        logging.exception("Пропущена строка на смещении %d: ошибка обогащения", line_offset)
+        return None
+
+
+def read_batches(path: Path, offset: int, batch_size: int):
+    """
+    Отдаёт ([(смещение строки, запись)], смещение после пачки),
+    не держа файл в памяти целиком.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        batch = []
+        while True:
+            line_offset = f.tell()
+            line = f.readline()
+            if not line:
+                break
+            line = line.strip()
+            if line:
+                try:
+                    batch.append((line_offset, json.loads(line)))
+                except json.JSONDecodeError as err:
+                    logging.warning("Пропущена битая строка на смещении %d: %s", line_offset, err)
+            if len(batch) >= batch_size:
+                yield batch, f.tell()
+                batch = []
+        if batch:
+            yield batch, f.tell()
+
+
+def load_checkpoint(path: Path) -> dict:
+    if path.exists():
+        return json.loads(path.read_text(encoding="utf-8"))
+    return {"offset": 0, "lines": 0, "accepted": 0, "skipped": 0}
+
+
+def save_checkpoint(path: Path, state: dict):
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(state), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def backfill(path: Path, checkpoint: Path, batch_size: int, gpt_workers: int, notify: bool):
+    state = load_checkpoint(checkpoint)
+    if state["offset"]:
+        logging.info("Продолжаю с смещения %d (строк обработано: %d)", state["offset"], state["lines"])
+
+    checker = dbnews.DBNewsDeduplicator(DB_CONFIG, notify_channel=NEWS_CHANNEL if notify else None)
+    text_filter = prefilter.TextPrefilter()
+    started = time.monotonic()
+    done_at_start = state["lines"]
+
+    with ThreadPoolExecutor(max_workers=gpt_workers, thread_name_prefix="backfill-gpt") as pool:
+        for records, offset in read_batches(path, state["offset"], batch_size):
+            # сырые копии отсекаем до GPT: check() резервирует текст, копии в той же
+            # пачке отсекаются; после сбоя GPT резерв снимается, и копия пройдёт
+            fresh, keys = [], []
+            for entry in records:
+                record = entry[1]
+                key = None
+                if not is_enriched(record):
+                    key = text_filter.check(record.get("text") or record.get("raw") or "")
+                    if key is None:
+                        continue
+                fresh.append(entry)
+                keys.append(key)
+            enriched = []
+            for e, key in zip(pool.map(enrich_safely, fresh), keys):
+                if e is None:
+                    state["skipped"] = state.get("skipped", 0) + 1
+                    if key is not None:
+                        text_filter.release(key)
+                    continue
+                if key is not None:
+                    text_filter.remember(key)
+                if e["text"]:
+                    enriched.append(e)
+
+            prepared = checker.prepare_many([e["text"] for e in enriched], batch_size=batch_size)
+            for item, prep in zip(enriched, prepared):
+                checker.accept(item["text"], item["tickers"], item["polarity"], item["intensity"], prep,
+                               published_time=item["published_time"])
+            written = checker.flush()
+            while checker.pending:
+                # запись прервал сбой БД: контрольную точку двигаем только после повтора
+                time.sleep(dbnews.RETRY_BASE)
+                written += checker.flush()
+
+            state["offset"] = offset
+            state["lines"] += len(records)
+            state["accepted"] += len(written)
+            save_checkpoint(checkpoint, state)
+
+            elapsed = time.monotonic() - started
+            logging.info("строк %d, записано %d, пропущено %d, %.1f строк/с",
+                         state["lines"], state["accepted"], state.get("skipped", 0),
+                         (state["lines"] - done_at_start) / max(elapsed, 1e-9))
+
+    checker.close()
+    logging.info("Готово: строк %d, записано новостей %d", state["lines"], state["accepted"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Загрузка новостей из JSONL-архива")
+    parser.add_argument("archive", type=Path)
+    parser.add_argument("--checkpoint", type=Path, help="файл контрольной точки (по умолчанию <archive>.ckpt)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--gpt-workers", type=int, default=GPT_WORKERS)
+    parser.add_argument("--restart", action="store_true", help="игнорировать контрольную точку")
+    parser.add_argument("--notify", action="store_true",
+                        help="слать NOTIFY о каждой новости (по умолчанию бот о загрузке истории не узнаёт)")
+    args = parser.parse_args()
+
+    checkpoint = args.checkpoint or args.archive.with_name(args.archive.name + ".ckpt")
+    if args.restart and checkpoint.exists():
+        checkpoint.unlink()
+
+    partitions.prepare_schema()
+    backfill(args.archive, checkpoint, args.batch_size, args.gpt_workers, args.notify)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,107 @@
+# Генератор синтетических русскоязычных финансовых новостей для бенчмарков.
+# Часть новостей — управляемые почти-дубликаты уже сгенерированных:
+# точная копия, копия с другими пробелами/кавычками и подписью агентства,
+# перефраз с заменой слов.
+import random
+
+from utils.ticker_map import ticker_lookup
+
+# (шаблон, полярность, интенсивность)
+TEMPLATES = (
+    ("Компания «{org}» сообщила о росте чистой прибыли за {period} на {pct} % до {amount} млрд ₽. "
+     "Выручка увеличилась благодаря {driver}, а операционная маржа достигла {margin} %.", "positive", 8),
+    ("«{org}» отчиталась о снижении чистой прибыли за {period} на {pct} % до {amount} млрд ₽. "
+     "Менеджмент объяснил результат {driver} и ростом процентных расходов.", "negative", 3),
+    ("Совет директоров «{org}» рекомендовал дивиденды за {period} в размере {div} ₽ на акцию. "
+     "Дивидендная доходность составит около {margin} %, отсечка назначена на {day} июля.", "positive", 7),
+    ("Акции «{org}» упали на {pct} % на Мосбирже после сообщений о {driver}. "
+     "Аналитики понизили целевую цену бумаг до {div} ₽.", "negative", 2),
+    ("«{org}» объявила о запуске программы обратного выкупа акций на {amount} млрд ₽. "
+     "Выкуп пройдёт в течение {period} и будет финансироваться за счёт {driver}.", "positive", 7),
+    ("«{org}» провела размещение облигаций на {amount} млрд ₽ со ставкой купона {margin} %. "
+     "Средства направят на {driver}.", "neutral", 5),
+)
+PERIODS = ("первый квартал 2025 года", "второй квартал 2025 года", "девять месяцев", "2024 год", "полугодие")
+DRIVERS = (
+    "расширения ассортимента", "оптимизации логистики", "роста цен на сырьё", "ослабления рубля",
+    "санкционных ограничений", "запуска новых продуктов", "снижения спроса", "рефинансирования долга",
+)
+CREDITS = ("Интерфакс", "ТАСС", "РИА Новости", "РБК", "Финам")
+SYNONYMS = {
+    "сообщила": "заявила", "отчиталась": "сообщила", "снижении": "сокращении", "росте": "увеличении",
+    "рекомендовал": "предложил", "упали": "подешевели", "объявила": "сообщила", "провела": "завершила",
+    "Аналитики": "Эксперты", "Средства": "Привлечённые деньги",
+}
+
+
+class NewsGenerator:
+    """
+    Детерминированный (по seed) поток новостей.
+    dup_rate — доля почти-дубликатов; среди них exact_share — точные/косметические копии,
+    остальные — перефразы (их должен ловить семантический уровень, а не префильтр).
+    """
+
+    def __init__(self, seed: int = 42, dup_rate: float = 0.3, exact_share: float = 0.5):
+        self.rng = random.Random(seed)
+        self.dup_rate = dup_rate
+        self.exact_share = exact_share
+        self.orgs = [(name.capitalize(), ticker) for name, ticker in ticker_lookup.items()]
+        self.history: list[dict] = []
+
+    def _original(self) -> dict:
+        org, ticker = self.rng.choice(self.orgs)
+        template, polarity, intensity = self.rng.choice(TEMPLATES)
+        text = template.format(
+            org=org,
+            period=self.rng.choice(PERIODS),
+            pct=self.rng.randint(2, 60),
+            amount=self.rng.randint(1, 900),
+            driver=self.rng.choice(DRIVERS),
+            margin=self.rng.randint(3, 25),
+            div=self.rng.randint(5, 400),
+            day=self.rng.randint(1, 28),
+        )
+        return {"raw": text, "org": org, "tickers": [ticker], "polarity": polarity,
+                "intensity": intensity, "dup_of": None, "kind": "original"}
+
+    def _cosmetic(self, src: dict) -> str:
+        text = src["raw"].replace("«", '"').replace("»", '"')
+        text = text.replace(". ", ".  ") if self.rng.random() < 0.5 else " " + text + " "
+        return f"{text} — {self.rng.choice(CREDITS)}."
+
+    def _paraphrase(self, src: dict) -> str:
+        words = src["raw"].split(" ")
+        return " ".join(SYNONYMS.get(w, w) for w in words)
+
+    def next(self) -> dict:
+        if self.history and self.rng.random() < self.dup_rate:
+            src = self.rng.choice(self.history)
+            if self.rng.random() < self.exact_share:
+                raw = src["raw"] if self.rng.random() < 0.5 else self._cosmetic(src)
+                kind = "exact"
+            else:
+                raw = self._paraphrase(src)
+                kind = "paraphrase"
+            item = {**src, "raw": raw, "dup_of": src["id"], "kind": kind}
+        else:
+            item = self._original()
+        item["id"] = len(self.history)
+        self.history.append(item)
+        return item
+
+    def take(self, n: int) -> list[dict]:
+        return [self.next() for _ in range(n)]
+
+
+def stub_enrich(item: dict) -> dict:
+    """
+    Заглушка GPT-обогащения: тот же формат, что у data_refactor.enrich_news,
+    без сетевых вызовов. Сжатая новость — первое предложение.
+    """
+    first_sentence = item["raw"].strip().split(". ")[0].strip(" .") + "."
+    return {
+        "tickers": list(item["tickers"]),
+        "text": first_sentence,
+        "polarity": item["polarity"],
+        "intensity": item["intensity"],
+    }
@@ -2,7 +2,7 @@ from detect_tickers import detect_tickers
 from get_gpt_data import get_gpt_data
 import unique_checker
 
-def add_news(checker, news_list, ticker_lookup, ticker_list):
+def add_news(checker, news_list, ticker_lookup, ticker_list, prefilter=None):
     '''news_list = [
         "Розничная сеть «Магнит» объявила о рекордном росте чистой прибыли за второй квартал 2025 года: показатель увеличился на 25 % по сравнению с аналогичным периодом прошлого года. Компания отмечает, что основными драйверами стали расширение ассортимента и оптимизация логистических цепочек. В отчёте подчёркивается, что выручка выросла до 450 млрд ₽, а операционная маржа достигла 8 %. Генеральный директор «Магнита» связал успех с запуском программы лояльности и усилением работы в онлайн-канале. Представители сети также отметили высокую активность покупателей в регионах присутствия.",
         "Розничная сеть «Магнит» объявила о рекордном росте чистой прибыли за второй квартал 2025 года: показатель увеличился на 25 % по сравнению с аналогичным периодом прошлого года. Компания отмечает, что основными драйверами стали расширение ассортимента и оптимизация логистических цепочек. В отчёте подчёркивается, что выручка выросла до 450 млрд ₽, а операционная маржа достигла 8 %. Генеральный директор «Магнита» связал успех с запуском программы лояльности и усилением работы в онлайн-канале. Представители сети также отметили высокую активность покупателей в регионах присутствия.",
@@ -111,33 +111,38 @@ def add_news(checker, news_list, ticker_lookup, ticker_list):
     #or js in dict_list:
         #print(f"=== Новость ===\n{news}")
 
+        # 4.0. Дешёвый префильтр точных/почти точных копий — до GPT и эмбеддингов
+        prefilter_key = prefilter.check(news) if prefilter is not None else None
+        if prefilter is not None and prefilter_key is None:
+            print(f"[Дубликат: префильтр]")
+            continue
+
         # 4.1. Базовая детекция тикеров
         tickers = set(detect_tickers(news, ticker_lookup, ticker_list))
 
         # 4.2. Добыча доп. данных через GPT
-        data = get_gpt_data(news)
-        #data = js
-        #tickers = set()
-        # data['tickers'] — фрагменты текста для доп. детекции
-        for fragment in data.get('tickers', []):
-            tickers.update(detect_tickers(fragment, ticker_lookup, ticker_list))
-        # data['organizations'] — названия организаций для детекции
-        for org in data.get('organizations', []):
-            tickers.update(detect_tickers(org, ticker_lookup, ticker_list))
+        data = enrich_news(news, tickers, ticker_lookup, ticker_list)
+        if data is None:
+            print(f"[Пропущено: нет ответа GPT]")
+            if prefilter is not None:
+                prefilter.release(prefilter_key)
+            continue
+        tickers = data['tickers']
+        text = data['text']
+        polarity = data['polarity']
+        intensity = data['intensity']
 
         # Выводим
         print(f"Найденные тикеры: {tickers}")
-        print(f"Сжатое содержание: {data.get('compressed_message')}")
-        polarity = data.get('polarity')
-        intensity = int(data.get('intensity'))
+        print(f"Сжатое содержание: {text}")
         print(f"Полярность: {polarity}")
         print(f"Интенсивность: {intensity}")
 
-        text = data.get('compressed_message')
-
-        # 4.3. Проверяем и добавляем, если уникальна
-        print(data)
-        if checker.add_news(text = text, tickers = list(tickers), polarity = polarity, intensity = intensity):
+        # 4.3. Проверяем и добавляем, если уникальна; в префильтр — только после решения
+        added = checker.add_news(text = text, tickers = list(tickers), polarity = polarity, intensity = intensity)
+        if prefilter is not None:
+            prefilter.remember(prefilter_key)
+        if added:
             print(f"[Добавлено]")
             #print(f"[Добавлено] '{text}' → {tickers}")
         else:
@@ -145,6 +150,32 @@ def add_news(checker, news_list, ticker_lookup, ticker_list):
             #print(f"[Дубликат] '{text}' → {tickers}")
         print()
 
+def enrich_news(news, tickers, ticker_lookup, ticker_list):
+    """
+    Обогащает новость через GPT: сжатый текст, полярность, интенсивность
+    и дополнительные тикеры по фрагментам и организациям из ответа.
+    Возвращает словарь {'tickers', 'text', 'polarity', 'intensity'}
+    или None, если GPT не ответил.
+    """
+    data = get_gpt_data(news)
+    if data is None:
+        return None
+
+    tickers = set(tickers)
+    # data['tickers'] — фрагменты текста для доп. детекции
+    for fragment in data.get('tickers', []):
+        tickers.update(detect_tickers(fragment, ticker_lookup, ticker_list))
+    # data['organizations'] — названия организаций для детекции
+    for org in data.get('organizations', []):
+        tickers.update(detect_tickers(org, ticker_lookup, ticker_list))
+
+    return {
+        'tickers': sorted(tickers),
+        'text': data.get('compressed_message'),
+        'polarity': data.get('polarity'),
+        'intensity': int(data.get('intensity')),
+    }
+
 def print_news(checker):
     # 5. Вывод всех уникальных новостей
     print("\n=== Уникальные новости ===")
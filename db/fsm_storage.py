@@ -0,0 +1,153 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from contextvars import ContextVar
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Mapping
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from db import pool
+from utils import metrics
+
+log = logging.getLogger(__name__)
+
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory")   # memory | postgres
+STATE_TTL = timedelta(hours=int(os.getenv("FSM_STATE_TTL_HOURS", "24")))  # брошенный опрос забывается
+PURGE_INTERVAL = 3600  # секунд между удалениями просроченных строк
+
+FSM_READS = metrics.counter("fsm_storage_reads_total", "Чтения состояния FSM", ("result",))
+
+# Кеш чтений текущего апдейта: ключ → (state, data). Вне fsm_cache_middleware — None
+_update_cache: ContextVar[dict[str, tuple[str | None, dict]] | None] = ContextVar("fsm_update_cache", default=None)
+
+
+class PostgresStorage(BaseStorage):
+    """
+    Хранилище FSM aiogram в таблице fsm_state: состояние опроса и фильтра
+    переживает перезапуск и видно всем репликам бота за webhook.
+
+    Строка живёт STATE_TTL с последней записи; просроченная читается как
+    пустая и удаляется фоном раз в PURGE_INTERVAL.
+
+    get_state/get_data/update_data одного апдейта читают одну и ту же строку,
+    поэтому она кешируется — но только в пределах апдейта (fsm_cache_middleware).
+    Кеш между апдейтами не держим: следующий апдейт того же чата могла
+    обработать другая реплика, и закешированное состояние было бы устаревшим.
+    """
+
+    def __init__(self, key_builder: KeyBuilder | None = None, ttl: timedelta = STATE_TTL):
+        self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+        self.ttl = ttl
+        self._purged_at = time.monotonic()
+
+    async def _read(self, key: StorageKey) -> tuple[str | None, dict]:
+        k = self.key_builder.build(key)
+        cache = _update_cache.get()
+        if cache is not None and k in cache:
+            FSM_READS.inc(result="cache")
+            return cache[k]
+        row = await pool.fetchrow(
+            "fsm_get",
+            "SELECT state, data FROM fsm_state WHERE key = $1 AND expires_at > now()",
+            k
+        )
+        FSM_READS.inc(result="db")
+        state, data = (row["state"], json.loads(row["data"])) if row else (None, {})
+        self._remember(k, state, data)
+        return state, data
+
+    @staticmethod
+    def _remember(k: str, state: str | None, data: dict):
+        cache = _update_cache.get()
+        if cache is not None:
+            cache[k] = (state, data)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k = self.key_builder.build(key)
+        state = state.state if isinstance(state, State) else state
+        row = await pool.fetchrow(
+            "fsm_set_state",
+            """
+            INSERT INTO fsm_state (key, state, expires_at)
+            VALUES ($1, $2, now() + $3::interval)
+            ON CONFLICT (key) DO UPDATE
+              SET state = EXCLUDED.state,
+                  -- данные просроченной строки не воскрешаем
+                  data = CASE WHEN fsm_state.expires_at > now() THEN fsm_state.data ELSE '{}' END,
+                  expires_at = EXCLUDED.expires_at
+            RETURNING data
+            """,
+            k, state, self.ttl
+        )
+        self._remember(k, state, json.loads(row["data"]))
+        self._maybe_purge()
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        state, _ = await self._read(key)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        k = self.key_builder.build(key)
+        data = dict(data)
+        row = await pool.fetchrow(
+            "fsm_set_data",
+            """
+            INSERT INTO fsm_state (key, data, expires_at)
+            VALUES ($1, $2::jsonb, now() + $3::interval)
+            ON CONFLICT (key) DO UPDATE
+              SET data = EXCLUDED.data,
+                  state = CASE WHEN fsm_state.expires_at > now() THEN fsm_state.state END,
+                  expires_at = EXCLUDED.expires_at
+            RETURNING state
+            """,
+            k, json.dumps(data, ensure_ascii=False), self.ttl
+        )
+        self._remember(k, row["state"], data)
+        self._maybe_purge()
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        _, data = await self._read(key)
+        return dict(data)
+
+    async def close(self) -> None:
+        pass
+
+    def _maybe_purge(self):
+        if time.monotonic() - self._purged_at < PURGE_INTERVAL:
+            return
+        self._purged_at = time.monotonic()
+        asyncio.get_running_loop().create_task(self._purge())
+
+    async def _purge(self):
+        try:
+            deleted = await pool.execute("fsm_purge", "DELETE FROM fsm_state WHERE expires_at <= now()")
+            log.info("FSM: удалены просроченные состояния (%s)", deleted)
+        except Exception:
+            log.exception("FSM: не удалось удалить просроченные состояния")
+
+
+async def fsm_cache_middleware(handler: Callable[[Any, dict[str, Any]], Awaitable[Any]],
+                               event: Any, data: dict[str, Any]) -> Any:
+    """
+    Outer-middleware апдейта: кеш чтений PostgresStorage живёт ровно один апдейт.
+    Подключается как dp.update.outer_middleware(fsm_cache_middleware).
+    """
+    token = _update_cache.set({})
+    try:
+        return await handler(event, data)
+    finally:
+        _update_cache.reset(token)
+
+
+def create_storage(kind: str = FSM_STORAGE) -> BaseStorage:
+    """Хранилище FSM по FSM_STORAGE: memory — один процесс, postgres — общее для реплик."""
+    if kind == "memory":
+        return MemoryStorage()
+    if kind == "postgres":
+        return PostgresStorage()
+    raise RuntimeError(f"Неизвестный FSM_STORAGE={kind!r}: ожидается memory или postgres")
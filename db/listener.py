@@ -0,0 +1,61 @@
+import asyncio
+import logging
+from typing import Callable, Iterable
+
+import psycopg2
+import psycopg2.extensions
+
+from db.connector import get_db_connection
+
+log = logging.getLogger(__name__)
+
+RECONNECT_DELAY = 5  # секунды между попытками переподключения
+
+
+async def listen(channels: Iterable[str], on_notify: Callable[[str, str], None],
+                 on_connect: Callable[[], None] | None = None):
+    """
+    Подписывается через LISTEN на каналы Postgres и вызывает on_notify(channel, payload)
+    на каждое уведомление. Сокет соединения слушается через event loop,
+    так что ожидание не блокирует бота. При обрыве соединения переподключается.
+    on_connect() вызывается после каждой подписки: уведомления, пришедшие
+    без соединения, потеряны, и подписчик может перечитать состояние целиком.
+    """
+    channels = list(channels)
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            conn = get_db_connection()
+        except psycopg2.OperationalError as err:
+            log.error("LISTEN: нет соединения с БД: %s", err)
+            await asyncio.sleep(RECONNECT_DELAY)
+            continue
+
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            for channel in channels:
+                cur.execute(f"LISTEN {channel}")
+        log.info("LISTEN: подписка на %s", ", ".join(channels))
+        if on_connect is not None:
+            on_connect()
+
+        ready = asyncio.Event()
+        fd = conn.fileno()
+        loop.add_reader(fd, ready.set)
+        try:
+            while True:
+                await ready.wait()
+                ready.clear()
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    try:
+                        on_notify(notify.channel, notify.payload)
+                    except Exception:
+                        log.exception("LISTEN: ошибка обработки уведомления %s", notify.channel)
+        except psycopg2.OperationalError as err:
+            log.error("LISTEN: соединение потеряно: %s", err)
+        finally:
+            loop.remove_reader(fd)
+            conn.close()
+        await asyncio.sleep(RECONNECT_DELAY)
@@ -0,0 +1,222 @@
+import asyncio
+import gzip
+import logging
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from psycopg2 import sql
+
+from db.connector import engine, metadata, get_db_connection
+
+log = logging.getLogger(__name__)
+
+# Таблица news секционирована по неделям published_time (UTC, с понедельника).
+# Секция news_default ловит строки вне заведённых недель; maintain()
+# переносит их в недельные секции.
+
+# Окно «горячих» запросов: новостная лента и рассылка смотрят только сюда,
+# и планировщик отсекает старые секции (partition pruning)
+HOT_WINDOW = timedelta(days=7)
+
+WEEKS_AHEAD = 2                                                  # секций заводим наперёд
+RETENTION_WEEKS = int(os.getenv("NEWS_RETENTION_WEEKS", "26"))   # сколько недель держать в news
+ARCHIVE_DIR = Path(os.getenv("NEWS_ARCHIVE_DIR", "archive"))     # куда выгружать отсоединённые секции
+MAINTENANCE_INTERVAL = 6 * 3600                                  # секунды между проходами обслуживания
+
+DEFAULT_PARTITION = "news_default"
+_PARTITION_RE = re.compile(r"^news_w(\d{8})$")
+
+
+def week_start(ts: datetime) -> datetime:
+    ts = ts.astimezone(timezone.utc)
+    monday = ts - timedelta(days=ts.weekday())
+    return monday.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def partition_name(start: datetime) -> str:
+    return f"news_w{start:%Y%m%d}"
+
+
+def list_partitions(conn) -> dict[str, datetime]:
+    """Недельные секции news: имя → начало недели."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'news'::regclass
+        """)
+        names = [name for (name,) in cur.fetchall()]
+    result = {}
+    for name in names:
+        match = _PARTITION_RE.match(name)
+        if match:
+            result[name] = datetime.strptime(match.group(1), "%Y%m%d").replace(tzinfo=timezone.utc)
+    return result
+
+
+def _create_partition(cur, start: datetime):
+    """
+    Заводит секцию на неделю start. Строки этой недели, уже попавшие
+    в news_default, переносятся в неё: иначе Postgres не даст создать секцию.
+    """
+    end = start + timedelta(weeks=1)
+    name = sql.Identifier(partition_name(start))
+    cur.execute("""
+        SELECT EXISTS (SELECT 1 FROM news_default WHERE published_time >= %s AND published_time < %s)
+    """, (start, end))
+    (has_rows,) = cur.fetchone()
+    if has_rows:
+        cur.execute("CREATE TEMP TABLE news_moved (LIKE news) ON COMMIT DROP")
+        cur.execute("""
+            WITH moved AS (
+                DELETE FROM news_default
+                WHERE published_time >= %s AND published_time < %s
+                RETURNING *
+            )
+            INSERT INTO news_moved SELECT * FROM moved
+        """, (start, end))
+    cur.execute(
+        sql.SQL("CREATE TABLE {} PARTITION OF news FOR VALUES FROM (%s) TO (%s)").format(name),
+        (start, end),
+    )
+    if has_rows:
+        cur.execute("INSERT INTO news SELECT * FROM news_moved")
+        cur.execute("DROP TABLE news_moved")
+
+
+def ensure_partitions(conn, weeks_ahead: int = WEEKS_AHEAD) -> list[str]:
+    """
+    Заводит секцию по умолчанию, секции с текущей недели на weeks_ahead вперёд
+    и секции для недель, строки которых лежат в news_default (архивная загрузка).
+    Возвращает имена созданных секций.
+    """
+    created = []
+    with conn, conn.cursor() as cur:
+        cur.execute(sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF news DEFAULT")
+                    .format(sql.Identifier(DEFAULT_PARTITION)))
+        cur.execute("""
+            SELECT DISTINCT date_trunc('week', published_time AT TIME ZONE 'UTC')
+            FROM news_default
+        """)
+        weeks = {w.replace(tzinfo=timezone.utc) for (w,) in cur.fetchall()}
+        current = week_start(datetime.now(timezone.utc))
+        weeks.update(current + timedelta(weeks=i) for i in range(weeks_ahead + 1))
+
+        existing = list_partitions(conn)
+        for start in sorted(weeks):
+            if partition_name(start) not in existing:
+                _create_partition(cur, start)
+                created.append(partition_name(start))
+    if created:
+        log.info("Созданы секции news: %s", ", ".join(created))
+    return created
+
+
+def archive_partition(conn, name: str, archive_dir: Path = ARCHIVE_DIR) -> Path:
+    """
+    Отсоединяет секцию от news, выгружает её в <archive_dir>/<name>.copy.gz
+    (формат COPY, загружается обратно через COPY ... FROM) и удаляет вместе с её LSH-бэндами.
+    """
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    path = archive_dir / f"{name}.copy.gz"
+    tmp = path.with_name(path.name + ".tmp")
+    table = sql.Identifier(name)
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute(sql.SQL("ALTER TABLE news DETACH PARTITION {}").format(table))
+            with gzip.open(tmp, "wt", encoding="utf-8") as f:
+                cur.copy_expert(sql.SQL("COPY {} TO STDOUT").format(table).as_string(conn), f)
+            cur.execute(sql.SQL("DELETE FROM news_lsh WHERE news_id IN (SELECT id FROM {})").format(table))
+            cur.execute(sql.SQL("DROP TABLE {}").format(table))
+    except Exception:
+        # транзакция откатилась — секция осталась в news, недописанный архив не нужен
+        tmp.unlink(missing_ok=True)
+        raise
+    os.replace(tmp, path)
+    log.info("Секция %s выгружена в %s", name, path)
+    return path
+
+
+def apply_retention(conn, retention_weeks: int = RETENTION_WEEKS, archive_dir: Path = ARCHIVE_DIR) -> list[Path]:
+    """Архивирует секции, целиком старше retention_weeks недель."""
+    cutoff = week_start(datetime.now(timezone.utc)) - timedelta(weeks=retention_weeks)
+    expired = sorted(name for name, start in list_partitions(conn).items()
+                     if start + timedelta(weeks=1) <= cutoff)
+    return [archive_partition(conn, name, archive_dir) for name in expired]
+
+
+def _rename_legacy(conn) -> bool:
+    """Старая несекционированная news переименовывается в news_legacy, чтобы create_all создал новую."""
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('news')")
+        row = cur.fetchone()
+        if row is None or row[0] == "p":
+            return False
+        log.warning("news не секционирована: переношу данные в секционированную таблицу")
+        cur.execute("ALTER TABLE news RENAME TO news_legacy")
+        cur.execute("ALTER SEQUENCE IF EXISTS news_id_seq RENAME TO news_legacy_id_seq")
+        cur.execute("ALTER TABLE news_legacy RENAME CONSTRAINT news_pkey TO news_legacy_pkey")
+    return True
+
+
+def _copy_legacy(conn):
+    # времени публикации у старых строк нет — считаем их опубликованными сейчас
+    with conn, conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO news (id, published_time, text, ticker, polarity, intensity, minhash, embedding)
+            SELECT id, now(), text, ticker, polarity, intensity, minhash, embedding
+            FROM news_legacy
+        """)
+        cur.execute("SELECT setval('news_id_seq', COALESCE((SELECT max(id) FROM news), 1))")
+        cur.execute("DROP TABLE news_legacy")
+
+
+# Колонки, добавленные в существующие таблицы позже их создания: create_all их не досоздаёт
+_ADDED_COLUMNS = [
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS last_news_id integer",
+    "ALTER TABLE news ADD COLUMN IF NOT EXISTS sources integer NOT NULL DEFAULT 1",
+]
+
+
+def prepare_schema():
+    """Создаёт таблицы и секции news; при старте любого процесса вместо metadata.create_all."""
+    conn = get_db_connection()
+    try:
+        legacy = _rename_legacy(conn)
+        metadata.create_all(engine)
+        with conn, conn.cursor() as cur:
+            for statement in _ADDED_COLUMNS:
+                cur.execute(statement)
+        ensure_partitions(conn)
+        if legacy:
+            _copy_legacy(conn)
+    finally:
+        conn.close()
+
+
+def maintain(retention_weeks: int = RETENTION_WEEKS, archive_dir: Path = ARCHIVE_DIR):
+    conn = get_db_connection()
+    try:
+        ensure_partitions(conn)
+        apply_retention(conn, retention_weeks, archive_dir)
+    finally:
+        conn.close()
+
+
+async def maintenance_loop(interval: float = MAINTENANCE_INTERVAL):
+    """Периодически заводит новые секции и архивирует старые (в потоке, чтобы не блокировать loop)."""
+    while True:
+        try:
+            await asyncio.to_thread(maintain)
+        except Exception:
+            log.exception("Ошибка обслуживания секций news")
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    prepare_schema()
+    maintain()
@@ -0,0 +1,107 @@
+import time
+
+import asyncpg
+from pgvector.asyncpg import register_vector
+
+from db.connector import DB_CONFIG
+from utils import metrics
+
+POOL_MIN_SIZE = 2
+POOL_MAX_SIZE = 20
+# asyncpg готовит (PREPARE) каждый запрос при первом выполнении на соединении
+# и кеширует план; хендлеры используют фиксированный набор запросов
+STATEMENT_CACHE_SIZE = 256
+
+ACQUIRE_SECONDS = metrics.histogram("db_pool_acquire_seconds", "Ожидание соединения из пула")
+QUERY_SECONDS = metrics.histogram("db_query_seconds", "Время запроса через пул", ("query",))
+POOL_CONNECTIONS = metrics.gauge("db_pool_connections", "Соединения пула по состоянию", ("state",))
+
+_pool: asyncpg.Pool | None = None
+
+
+async def init_pool(min_size: int = POOL_MIN_SIZE, max_size: int = POOL_MAX_SIZE) -> asyncpg.Pool:
+    """Создаёт общий пул соединений процесса. Вызывается один раз при старте."""
+    global _pool
+    if _pool is None:
+        _pool = await asyncpg.create_pool(
+            database=DB_CONFIG["dbname"],
+            user=DB_CONFIG["user"],
+            password=DB_CONFIG["password"],
+            host=DB_CONFIG["host"],
+            port=DB_CONFIG["port"],
+            min_size=min_size,
+            max_size=max_size,
+            statement_cache_size=STATEMENT_CACHE_SIZE,
+            init=_init_connection,
+        )
+        POOL_CONNECTIONS.set_function(_pool_stats)
+    return _pool
+
+
+async def _init_connection(conn: asyncpg.Connection):
+    # колонки vector читаются как numpy-массивы (news.embedding, user_topics.embedding)
+    await register_vector(conn)
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+def get_pool() -> asyncpg.Pool:
+    if _pool is None:
+        raise RuntimeError("Пул БД не инициализирован: вызовите init_pool() при старте")
+    return _pool
+
+
+def _pool_stats() -> dict[tuple, int]:
+    if _pool is None:
+        return {}
+    size = _pool.get_size()
+    idle = _pool.get_idle_size()
+    return {("total",): size, ("idle",): idle, ("in_use",): size - idle}
+
+
+class _Acquire:
+    """`async with acquire() as conn:` — соединение из пула с замером ожидания."""
+
+    async def __aenter__(self) -> asyncpg.Connection:
+        start = time.perf_counter()
+        self._ctx = get_pool().acquire()
+        conn = await self._ctx.__aenter__()
+        ACQUIRE_SECONDS.observe(time.perf_counter() - start)
+        return conn
+
+    async def __aexit__(self, *exc):
+        return await self._ctx.__aexit__(*exc)
+
+
+def acquire() -> _Acquire:
+    return _Acquire()
+
+
+async def fetch(name: str, query: str, *args) -> list[asyncpg.Record]:
+    """name — короткое имя запроса для метрик."""
+    async with acquire() as conn:
+        with QUERY_SECONDS.time(query=name):
+            return await conn.fetch(query, *args)
+
+
+async def fetchrow(name: str, query: str, *args) -> asyncpg.Record | None:
+    async with acquire() as conn:
+        with QUERY_SECONDS.time(query=name):
+            return await conn.fetchrow(query, *args)
+
+
+async def fetchval(name: str, query: str, *args):
+    async with acquire() as conn:
+        with QUERY_SECONDS.time(query=name):
+            return await conn.fetchval(query, *args)
+
+
+async def execute(name: str, query: str, *args) -> str:
+    async with acquire() as conn:
+        with QUERY_SECONDS.time(query=name):
+            return await conn.execute(query, *args)
@@ -1,4 +1,10 @@
+import hashlib
+import logging
+import threading
+import time
+
 import psycopg2
+from psycopg2.extras import execute_values
 from pgvector.psycopg2 import register_vector
 from pgvector import Vector
 import numpy as np
@@ -6,19 +12,45 @@ from sentence_transformers import SentenceTransformer
 from datasketch import MinHash
 import pickle
 
+from db.partitions import HOT_WINDOW
+from utils import metrics
+
+log = logging.getLogger(__name__)
+
+RETRY_BASE = 1.0   # секунд до повторной записи после сбоя БД; удваивается с каждым сбоем подряд
+RETRY_MAX = 60.0
+# Ошибки, вызванные самой строкой: повтор не поможет, строку отбрасываем.
+# Прочие (блокировка, таймаут, обрыв соединения) — повод подождать и повторить
+_DATA_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError)
+
+EMBED_SECONDS = metrics.histogram("embedding_seconds", "Расчёт эмбеддинга новости")
+EMBED_BATCH_SECONDS = metrics.histogram("embedding_batch_seconds", "Расчёт эмбеддингов пачки новостей")
+DEDUP_QUERY_SECONDS = metrics.histogram("dedup_query_seconds", "Запрос кандидатов в дубликаты (на тикер)")
+INSERT_SECONDS = metrics.histogram("news_insert_seconds", "Запись пачки новостей в БД")
+INSERTED = metrics.counter("news_inserted_total", "Записано новостей")
+DROPPED = metrics.counter("news_dropped_total", "Новости, отброшенные после неудачной записи")
+REPEATS = metrics.counter("news_repeats_total", "Отклонённые дубликаты, засчитанные как ещё один источник")
+
 
 class DBNewsDeduplicator:
     def __init__(self,
                  db_config,
+                 notify_channel=None,
                  shingle_size=4,
                  n_perm=256,
                  emb_model='all-MiniLM-L6-v2',
                  threshold_jaccard=0.05,
                  threshold_cosine=0.4,
                  alpha=0.5,
-                 sentiment_diff_thresh=2):
+                 sentiment_diff_thresh=2,
+                 lsh_bands=64,
+                 lsh_max_candidates=200,
+                 dedup_window=HOT_WINDOW):
+        self.db_config = db_config
         self.conn = psycopg2.connect(**db_config)
         register_vector(self.conn)
+        # канал LISTEN/NOTIFY, в который после записи уходят id новостей
+        self.notify_channel = notify_channel
         self.shingle_size = shingle_size
         self.n_perm = n_perm
         self.model = SentenceTransformer(emb_model)
@@ -26,76 +58,416 @@ class DBNewsDeduplicator:
         self.threshold_c = threshold_cosine
         self.alpha = alpha
         self.sentiment_diff_thresh = sentiment_diff_thresh
+        # LSH: n_perm хешей режутся на lsh_bands бэндов по lsh_rows строк
+        if n_perm % lsh_bands:
+            raise ValueError("n_perm должен делиться на lsh_bands без остатка")
+        self.lsh_bands = lsh_bands
+        self.lsh_rows = n_perm // lsh_bands
+        self.lsh_max_candidates = lsh_max_candidates
+        # дубликаты ищутся только среди новостей ±dedup_window от времени новой:
+        # запрос затрагивает одну-две недельные секции news, а не всю историю
+        self.dedup_window = dedup_window
+        # Принятые, но ещё не записанные новости (см. accept/flush).
+        # Проверка дубликатов учитывает их наравне с таблицей news.
+        self._pending: list[dict] = []
+        # id записанной новости → сколько дубликатов пришло с прошлого flush (news.sources)
+        self._repeats: dict[int, int] = {}
+        self._flush_failures = 0   # сбоев записи подряд, задают паузу до повтора
+        self._retry_at = 0.0       # time.monotonic(), раньше которого flush не пишет
+        # Одно соединение на несколько стадий конвейера — доступ строго по очереди
+        self._lock = threading.RLock()
 
-    def _minhash(self, text: str) -> bytes:
+    def _signature(self, text: str) -> MinHash:
         m = MinHash(num_perm=self.n_perm)
         for i in range(len(text) - self.shingle_size + 1):
             m.update(text[i:i + self.shingle_size].encode('utf-8'))
-        return pickle.dumps(m)
+        return m
+
+    def _minhash(self, text: str) -> bytes:
+        return pickle.dumps(self._signature(text))
 
+    def _bands(self, m: MinHash) -> tuple[list[int], list[int]]:
+        """
+        Режет MinHash-подпись на бэнды и сворачивает каждый в signed int64,
+        чтобы хранить его в BIGINT-колонке news_lsh.hash.
+        """
+        bands, hashes = [], []
+        for b in range(self.lsh_bands):
+            chunk = m.hashvalues[b * self.lsh_rows:(b + 1) * self.lsh_rows]
+            digest = hashlib.blake2b(chunk.tobytes(), digest_size=8).digest()
+            bands.append(b)
+            hashes.append(int.from_bytes(digest, 'big', signed=True))
+        return bands, hashes
+
+    @EMBED_SECONDS.time()
     def _embed(self, text: str) -> np.ndarray:
         vec = self.model.encode([text], convert_to_numpy=True)[0]
         return vec / np.linalg.norm(vec)
 
-    def _is_duplicate_for_ticker(self, text: str, ticker: str, new_pol: str, new_int: int) -> bool:
-        cur = self.conn.cursor()
-        vec_np = self._embed(text)
+    def _is_duplicate_for_ticker(self, text: str, ticker: str, new_pol: str, new_int: int,
+                                 m_new: MinHash = None, vec_np: np.ndarray = None,
+                                 published_time=None) -> bool:
+        return self._find_duplicate(text, ticker, new_pol, new_int, m_new, vec_np, published_time) is not None
+
+    def _find_duplicate(self, text: str, ticker: str, new_pol: str, new_int: int,
+                        m_new: MinHash = None, vec_np: np.ndarray = None, published_time=None):
+        """Первый найденный дубликат по тикеру: id из news, запись из _pending или None."""
+        if m_new is None:
+            m_new = self._signature(text)
+        if vec_np is None:
+            vec_np = self._embed(text)
         vec_pg = Vector(vec_np.tolist())
+        bands, hashes = self._bands(m_new)
 
+        # Кандидаты: совпадение хотя бы одного LSH-бэнда (индекс по band, hash)
+        # плюс 20 ближайших соседей по эмбеддингу — всё в окне вокруг published_time
         query = """
+        WITH win AS (
+            SELECT COALESCE(%s::timestamptz, now()) - %s AS lo,
+                   COALESCE(%s::timestamptz, now()) + %s AS hi
+        ), lsh AS (
+            SELECT DISTINCT l.news_id AS id
+            FROM unnest(%s::smallint[], %s::bigint[]) AS b(band, hash)
+            JOIN news_lsh l ON l.band = b.band AND l.hash = b.hash
+            JOIN news n ON n.id = l.news_id
+            CROSS JOIN win
+            WHERE %s = ANY(n.ticker)
+              AND n.published_time BETWEEN win.lo AND win.hi
+            LIMIT %s
+        ), knn AS (
+            SELECT id
+            FROM news, win
+            WHERE %s = ANY(ticker)
+              AND published_time BETWEEN win.lo AND win.hi
+            ORDER BY embedding <-> %s
+            LIMIT 20
+        )
         SELECT id, text, ticker, polarity, intensity, minhash, embedding
-        FROM news
-        WHERE %s = ANY(ticker)
-        ORDER BY embedding <-> %s
-        LIMIT 20
+        FROM news, win
+        WHERE id IN (SELECT id FROM lsh UNION SELECT id FROM knn)
+          AND published_time BETWEEN win.lo AND win.hi
         """
-        cur.execute(query, (ticker, vec_pg))
-        rows = cur.fetchall()
-        cur.close()
+        with self._lock, DEDUP_QUERY_SECONDS.time():
+            cur = self.conn.cursor()
+            cur.execute(query, (published_time, self.dedup_window, published_time, self.dedup_window,
+                                bands, hashes, ticker, self.lsh_max_candidates, ticker, vec_pg))
+            rows = cur.fetchall()
+            cur.close()
+            pending = [p for p in self._pending if ticker in p['tickers']]
 
-        if not rows:
-            return False
-
-        m_new = pickle.loads(self._minhash(text))
         for row in rows:
             old_id, old_text, old_tickers, old_pol, old_int, mh_bytes, emb_vec = row
+            m_old = pickle.loads(bytes(mh_bytes))
+            vec_old = np.array(emb_vec, dtype=np.float32)
+            if self._similar(m_new, vec_np, new_pol, new_int, m_old, vec_old, old_pol, old_int):
+                return old_id
 
-            if new_pol != old_pol or abs(new_int - old_int) > self.sentiment_diff_thresh:
-                continue
+        for p in pending:
+            if self._similar(m_new, vec_np, new_pol, new_int,
+                             p['minhash'], p['embedding'], p['polarity'], p['intensity']):
+                return p
 
-            m_old = pickle.loads(bytes(mh_bytes))
-            jaccard = m_new.jaccard(m_old)
+        return None
 
-            vec_old = np.array(emb_vec, dtype=np.float32)
-            cosine = float(np.dot(vec_old, vec_np) / (np.linalg.norm(vec_old) * np.linalg.norm(vec_np)))
+    def _similar(self, m_new, vec_new, new_pol, new_int, m_old, vec_old, old_pol, old_int) -> bool:
+        if new_pol != old_pol or abs(new_int - old_int) > self.sentiment_diff_thresh:
+            return False
 
-            if jaccard >= self.threshold_j and cosine >= self.threshold_c:
-                return True
+        jaccard = m_new.jaccard(m_old)
+        cosine = float(np.dot(vec_old, vec_new) / (np.linalg.norm(vec_old) * np.linalg.norm(vec_new)))
+        return jaccard >= self.threshold_j and cosine >= self.threshold_c
 
-        return False
+    def prepare(self, text: str) -> tuple[MinHash, np.ndarray]:
+        """MinHash и эмбеддинг текста — CPU-часть проверки, без обращения к БД."""
+        return self._signature(text), self._embed(text)
 
-    def add_news(self, text: str, tickers: list[str], polarity: str, intensity: int) -> bool:
-        unique_tickers = []
+    def prepare_many(self, texts: list[str], batch_size: int = 64) -> list[tuple[MinHash, np.ndarray]]:
+        """prepare для пачки: эмбеддинги считаются одним вызовом модели."""
+        if not texts:
+            return []
+        vecs = self.embed_many(texts, batch_size)
+        return [(self._signature(text), vec) for text, vec in zip(texts, vecs)]
+
+    def embed_many(self, texts: list[str], batch_size: int = 64) -> np.ndarray:
+        """Нормированные эмбеддинги пачки текстов (новости, темы пользователей)."""
+        with EMBED_BATCH_SECONDS.time():
+            vecs = self.model.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+        return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+    def check(self, text: str, tickers: list[str], polarity: str, intensity: int,
+              prepared: tuple[MinHash, np.ndarray] = None, published_time=None) -> list[str]:
+        """
+        Возвращает тикеры, для которых новость не является дубликатом.
+        published_time — время публикации (для архивных новостей), по умолчанию сейчас.
+        """
+        unique, _ = self._check(text, tickers, polarity, intensity, prepared, published_time)
+        return unique
+
+    def _check(self, text, tickers, polarity, intensity, prepared=None, published_time=None):
+        """check, который заодно возвращает найденные дубликаты (id или записи _pending)."""
+        m_new, vec_np = prepared or self.prepare(text)
+        unique, matches = [], []
         for ticker in tickers:
-            if not self._is_duplicate_for_ticker(text, ticker, polarity, intensity):
-                unique_tickers.append(ticker)
+            match = self._find_duplicate(text, ticker, polarity, intensity, m_new, vec_np, published_time)
+            if match is None:
+                unique.append(ticker)
+            else:
+                matches.append(match)
+        return unique, matches
 
-        if not unique_tickers:
-            return False
+    def accept(self, text: str, tickers: list[str], polarity: str, intensity: int,
+               prepared: tuple[MinHash, np.ndarray] = None, published_time=None) -> bool:
+        """
+        Проверяет новость и, если она уникальна хотя бы для одного тикера,
+        ставит её в очередь на запись (flush). Проверка и постановка
+        выполняются атомарно, поэтому два близких дубликата не пройдут оба.
+        Отклонённый дубликат засчитывается найденной новости как ещё один
+        источник (news.sources).
+        """
+        m_new, vec_np = prepared or self.prepare(text)
+        with self._lock:
+            unique, matches = self._check(text, tickers, polarity, intensity, (m_new, vec_np), published_time)
+            if not unique:
+                self._count_repeat(matches)
+                return False
+            self._pending.append({
+                'text': text,
+                'tickers': list(tickers),
+                'polarity': polarity,
+                'intensity': intensity,
+                'minhash': m_new,
+                'embedding': vec_np,
+                'published_time': published_time,
+                'sources': 1,
+            })
+        return True
+
+    def _count_repeat(self, matches: list):
+        # одна новость с несколькими тикерами может совпасть с одной и той же по каждому
+        seen = set()
+        for match in matches:
+            key = match if isinstance(match, int) else id(match)
+            if key in seen:
+                continue
+            seen.add(key)
+            if isinstance(match, int):
+                self._repeats[match] = self._repeats.get(match, 0) + 1
+            else:
+                match['sources'] += 1
+        REPEATS.inc()
+
+    @property
+    def pending(self) -> int:
+        """Принятые, но ещё не записанные новости."""
+        return len(self._pending)
+
+    def flush(self) -> list[dict]:
+        """
+        Записывает принятые новости в news и news_lsh одной транзакцией
+        вместе с накопленными счётчиками источников.
+        Возвращает записанные новости с присвоенными id.
+
+        Если пачка не записалась из-за данных (_DATA_ERRORS), новости пишутся
+        по одной: строка, которая не записывается никогда (время вне секций,
+        слишком длинный текст), отбрасывается, а не блокирует конвейер.
+        При остальных ошибках ничего не теряется: пачка ждёт повтора с паузой
+        RETRY_BASE·2ⁿ, оборванное соединение открывается заново.
+        """
+        with self._lock:
+            if not self._pending and not self._repeats:
+                return []
+            if time.monotonic() < self._retry_at:
+                return []
+            try:
+                written = self._write_batch()
+                self._pending = []
+                self._repeats = {}
+            except _DATA_ERRORS:
+                log.exception("Пачка из %d новостей не записалась, пишем по одной", len(self._pending))
+                written = self._write_one_by_one()
+            except Exception as err:
+                self._backoff(err)
+                raise
+            if not self._pending and not self._repeats:
+                self._flush_failures = 0
+        INSERTED.inc(len(written))
+
+        return [
+            {key: item[key] for key in ('id', 'text', 'tickers', 'polarity', 'intensity', 'sources', 'published_time')}
+            for item in written
+        ]
+
+    def _write_batch(self) -> list[dict]:
+        cur = self.conn.cursor()
+        try:
+            self._update_repeats(cur)
+            if self._pending:
+                with INSERT_SECONDS.time():
+                    self._insert(cur, self._pending)
+            self.conn.commit()
+        except Exception:
+            self._rollback()
+            raise
+        finally:
+            cur.close()
+        return self._pending
+
+    def _write_one_by_one(self) -> list[dict]:
+        """
+        Пишет счётчики и новости отдельными транзакциями, отбрасывая строки
+        с ошибками данных. На прочей ошибке останавливается: незаписанное
+        остаётся в _pending/_repeats до следующего flush.
+        """
+        written = []
+        done = 0
+        try:
+            if self._repeats:
+                if not self._write_step(self._update_repeats):
+                    log.error("Счётчики источников не записаны и отброшены")
+                self._repeats = {}
+            for item in self._pending:
+                if self._write_step(lambda cur: self._insert(cur, [item])):
+                    written.append(item)
+                else:
+                    log.error("Новость отброшена: не записывается (%.80r)", item['text'])
+                    DROPPED.inc()
+                done += 1
+        except Exception as err:
+            log.exception("Запись по одной прервана, ждут повтора: %d новостей", len(self._pending) - done)
+            self._backoff(err)
+        self._pending = self._pending[done:]
+        return written
 
+    def _write_step(self, step) -> bool:
+        """True — записано, False — отброшено из-за данных; прочие ошибки пробрасываются."""
         cur = self.conn.cursor()
-        minhash_bytes = self._minhash(text)
-        embedding_vec = Vector(self._embed(text).tolist())
+        try:
+            step(cur)
+            self.conn.commit()
+            return True
+        except _DATA_ERRORS as err:
+            self._rollback()
+            log.warning("Ошибка данных при записи: %s", err)
+            return False
+        except Exception:
+            self._rollback()
+            raise
+        finally:
+            cur.close()
+
+    def _rollback(self):
+        # на оборванном соединении rollback сам падает и скрыл бы исходную ошибку
+        if self.conn.closed:
+            return
+        try:
+            self.conn.rollback()
+        except psycopg2.Error:
+            log.warning("Откат транзакции не удался", exc_info=True)
 
+    def _backoff(self, err: Exception):
+        self._flush_failures += 1
+        delay = min(RETRY_MAX, RETRY_BASE * 2 ** (self._flush_failures - 1))
+        self._retry_at = time.monotonic() + delay
+        log.warning("Запись новостей не удалась (%s), повтор через %.0f с", type(err).__name__, delay)
+        if self.conn.closed or isinstance(err, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+            self._reconnect()
+
+    def _reconnect(self):
+        try:
+            self.conn.close()
+        except psycopg2.Error:
+            pass
+        try:
+            self.conn = psycopg2.connect(**self.db_config)
+            register_vector(self.conn)
+        except psycopg2.Error:
+            log.exception("Не удалось переподключиться к БД, попробуем при следующей записи")
+
+    def _update_repeats(self, cur):
+        if not self._repeats:
+            return
         cur.execute("""
-            INSERT INTO news (text, ticker, polarity, intensity, minhash, embedding)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """, (text, tickers, polarity, intensity, memoryview(minhash_bytes), embedding_vec))
+            UPDATE news AS n SET sources = n.sources + r.n
+            FROM unnest(%s::int[], %s::int[]) AS r(id, n)
+            WHERE n.id = r.id
+        """, (list(self._repeats), list(self._repeats.values())))
 
-        self.conn.commit()
-        cur.close()
+    def _insert(self, cur, items: list[dict]):
+        """Пишет новости, их LSH-бэнды и NOTIFY в текущую транзакцию."""
+        # id берутся из последовательности заранее и вставляются явно:
+        # порядок строк RETURNING не гарантирован, а так id однозначно
+        # принадлежит своей новости
+        cur.execute("SELECT nextval('news_id_seq') FROM generate_series(1, %s)", (len(items),))
+        for item, (news_id,) in zip(items, sorted(cur.fetchall())):
+            item['id'] = news_id
+        # один многострочный INSERT на всю пачку
+        returned = execute_values(cur, """
+            INSERT INTO news (id, text, ticker, polarity, intensity, minhash, embedding, sources,
+                              published_time)
+            VALUES %s
+            RETURNING id, published_time
+        """, [
+            (item['id'], item['text'], item['tickers'], item['polarity'], item['intensity'],
+             memoryview(pickle.dumps(item['minhash'])), Vector(item['embedding'].tolist()),
+             item['sources'], item['published_time'])
+            for item in items
+        ], template="(%s, %s, %s, %s, %s, %s, %s, %s, COALESCE(%s::timestamptz, now()))",
+           page_size=len(items), fetch=True)
+        published = dict(returned)
+        for item in items:
+            item['published_time'] = published[item['id']]
+        self._insert_bands(cur, [(item['id'], item['minhash']) for item in items])
+        if self.notify_channel:
+            # уведомления доставляются подписчикам только после commit
+            cur.execute("SELECT pg_notify(%s, id::text) FROM unnest(%s::int[]) AS id",
+                        (self.notify_channel, [item['id'] for item in items]))
+
+    def add_news(self, text: str, tickers: list[str], polarity: str, intensity: int) -> bool:
+        with self._lock:
+            if not self.accept(text, tickers, polarity, intensity):
+                return False
+            self.flush()
         return True
 
+    def _insert_bands(self, cur, items: list[tuple[int, MinHash]]):
+        rows = []
+        for news_id, m in items:
+            bands, hashes = self._bands(m)
+            rows.extend((news_id, b, h) for b, h in zip(bands, hashes))
+        execute_values(
+            cur,
+            "INSERT INTO news_lsh (news_id, band, hash) VALUES %s",
+            rows,
+            page_size=1000,
+        )
+
+    def rebuild_lsh_bands(self, batch_size: int = 1000) -> int:
+        """
+        Пересчитывает news_lsh по сохранённым MinHash-подписям.
+        Нужно для строк, добавленных до появления таблицы, и при смене lsh_bands.
+        Возвращает число обработанных новостей.
+        """
+        with self._lock:
+            cur = self.conn.cursor()
+            cur.execute("TRUNCATE news_lsh")
+
+            # серверный курсор: история читается порциями, а не целиком в память
+            read_cur = self.conn.cursor(name='news_lsh_rebuild')
+            read_cur.itersize = batch_size
+            read_cur.execute("SELECT id, minhash FROM news ORDER BY id")
+            count = 0
+            while True:
+                rows = read_cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                self._insert_bands(cur, [(news_id, pickle.loads(bytes(mh_bytes))) for news_id, mh_bytes in rows])
+                count += len(rows)
+            read_cur.close()
+
+            self.conn.commit()
+            cur.close()
+        return count
+
     def get_unique(self) -> list[dict]:
         cur = self.conn.cursor()
         cur.execute("SELECT text, ticker FROM news")
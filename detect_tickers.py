@@ -2,10 +2,15 @@ import re
 import spacy
 from rapidfuzz import process
 
+from utils import metrics
+
 # Загрузите модель командой:
 # python -m spacy download ru_core_news_sm
 nlp = spacy.load("ru_core_news_sm")
 
+DETECT_SECONDS = metrics.histogram("detect_tickers_seconds", "Время detect_tickers")
+
+@DETECT_SECONDS.time()
 def detect_tickers(
     text: str,
     ticker_lookup: dict[str, str],
@@ -2,6 +2,11 @@ from gpt import *
 import json
 import re
 
+from utils import metrics
+
+GPT_SECONDS = metrics.histogram("gpt_roundtrip_seconds", "Полный цикл запроса к GPT")
+GPT_REQUESTS = metrics.counter("gpt_requests_total", "Запросы к GPT по исходу", ("result",))
+
 def extract_and_parse(raw: str):
     """
     Извлекает из произвольной строки участок от первого { до последнего }
@@ -15,6 +20,7 @@ def extract_and_parse(raw: str):
     # теперь парсим
     return json.loads(json_str)
 
+@GPT_SECONDS.time()
 def get_gpt_data(
     text: str,
 ) -> list[str]:
@@ -31,8 +37,10 @@ def get_gpt_data(
     reply = get_response(did)
     if reply is not None:
         reset_dialog(did)
+        GPT_REQUESTS.inc(result="ok")
         return extract_and_parse(reply)
     else:
         reset_dialog(did)
+        GPT_REQUESTS.inc(result="timeout")
         return None
 
@@ -1,3 +1,4 @@
+import html
 import logging
 
 from aiogram import Router, types, F
@@ -5,7 +6,8 @@ from aiogram.fsm.context import FSMContext
 
 from states.filters import FilterStates
 from keyboards.inline import filter_kb, back_to_filter_kb, main_kb
-from db.connector import get_db_connection
+from services.topics import topic_index, MAX_TOPICS, MAX_TOPIC_LENGTH
+from services.user_cache import user_cache
 from utils.ticker_map import ticker_lookup
 
 router = Router()
@@ -47,19 +49,8 @@ async def process_tickers(message: types.Message, state: FSMContext):
             reply_markup=filter_kb
         )
 
-    conn = get_db_connection()
-    with conn:
-        with conn.cursor() as cur:
-            logging.info(f"Сохраняем фильтр {valid} для {tg_id}")
-            cur.execute(
-                """
-                INSERT INTO users (telegram_id, filter)
-                VALUES (%s, %s)
-                ON CONFLICT (telegram_id) DO UPDATE
-                  SET filter = EXCLUDED.filter
-                """,
-                (tg_id, valid)
-            )
+    logging.info(f"Сохраняем фильтр {valid} для {tg_id}")
+    await user_cache.save_filter(tg_id, valid)
 
     await state.clear()
     await message.answer(
@@ -68,18 +59,47 @@ async def process_tickers(message: types.Message, state: FSMContext):
     )
 
 
+@router.callback_query(F.data == "add_topics")
+async def add_topics(callback: types.CallbackQuery, state: FSMContext):
+    await callback.answer()
+    await state.set_state(FilterStates.waiting_for_topics)
+    await callback.message.answer(
+        f"Введите темы через запятую (не больше {MAX_TOPICS}), например: ставка ЦБ, дивиденды нефтянки.\n"
+        "Пришлём новости, близкие по смыслу, даже без тикера из фильтра.",
+        reply_markup=back_to_filter_kb
+    )
+
+
+@router.message(FilterStates.waiting_for_topics)
+async def process_topics(message: types.Message, state: FSMContext):
+    tg_id = message.from_user.id
+    topics = []
+    for t in message.text.split(","):
+        t = " ".join(t.split()).lower()[:MAX_TOPIC_LENGTH]
+        if t and t not in topics:
+            topics.append(t)
+    topics = topics[:MAX_TOPICS]
+
+    await state.clear()
+    if not topics:
+        return await message.answer("❌ Не найдено тем", reply_markup=filter_kb)
+
+    logging.info(f"Сохраняем темы {topics} для {tg_id}")
+    await topic_index.save_topics(tg_id, topics)
+
+    await message.answer(
+        f"✅ Темы обновлены:\n{', '.join(topics)}",
+        reply_markup=filter_kb
+    )
+
+
 @router.callback_query(F.data == "view_filter")
 async def view_filter(callback: types.CallbackQuery):
     await callback.answer()
     tg_id = callback.from_user.id
 
-    conn = get_db_connection()
-    with conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT filter FROM users WHERE telegram_id = %s", (tg_id,))
-            row = cur.fetchone()
-
-    raw = row[0] if row else None
+    profile = user_cache.get(tg_id)
+    raw = profile["filter"] if profile else None
 
     if not raw:
         items = []
@@ -93,6 +113,10 @@ async def view_filter(callback: types.CallbackQuery):
     else:
         text = "<b>Ваш текущий фильтр:</b>\n" + "\n".join(f"• {t}" for t in items)
 
+    topics = topic_index.topics(tg_id)
+    if topics:
+        text += "\n\n<b>Темы:</b>\n" + "\n".join(f"• {html.escape(t)}" for t in topics)
+
     await callback.message.edit_text(
         text,
         parse_mode="HTML",
@@ -105,15 +129,10 @@ async def delete_filter(callback: types.CallbackQuery):
     await callback.answer()
     tg_id = callback.from_user.id
 
-    conn = get_db_connection()
-    with conn:
-        with conn.cursor() as cur:
-            logging.info(f"Очищаем фильтр для {tg_id}")
-            # Обнуляем массив фильтра
-            cur.execute(
-                "UPDATE users SET filter = ARRAY[]::text[] WHERE telegram_id = %s",
-                (tg_id,)
-            )
+    logging.info(f"Очищаем фильтр для {tg_id}")
+    # Обнуляем массив фильтра и темы
+    await user_cache.clear_filter(tg_id)
+    await topic_index.clear_topics(tg_id)
 
     await callback.message.answer(
         "✅ Фильтр очищен.", reply_markup=filter_kb
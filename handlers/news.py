@@ -1,50 +1,60 @@
 from aiogram import Router, types, F
-from db.connector import get_db_connection
+from db import pool
+from db.partitions import HOT_WINDOW
+from services.news_cache import news_cache, NEWS_CACHE_READS
+from services.user_cache import user_cache
 from keyboards.inline import main_kb
+from utils.message_composer import compose
 
 router = Router()
 
+NEWS_LIMIT = 10
+
+
+async def fetch_latest(tickers: list[str], limit: int):
+    """Лента из БД — на холодном старте, пока news_cache не прогрет."""
+    NEWS_CACHE_READS.inc(result="cold")
+    if tickers:
+        return await pool.fetch(
+            "news_latest_by_tickers",
+            """
+            SELECT text
+            FROM news
+            WHERE ticker && $1::text[]
+              AND published_time > now() - $2::interval
+            ORDER BY id DESC
+            LIMIT $3
+            """,
+            tickers, HOT_WINDOW, limit
+        )
+    return await pool.fetch(
+        "news_latest",
+        """
+        SELECT text
+        FROM news
+        WHERE published_time > now() - $1::interval
+        ORDER BY id DESC
+        LIMIT $2
+        """,
+        HOT_WINDOW, limit
+    )
+
+
 @router.callback_query(F.data == "news")
 async def handle_news(callback: types.CallbackQuery):
     await callback.answer()
     tg_id = callback.from_user.id
 
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cur:
-            # 1) Читаем массив фильтра (TEXT[])
-            cur.execute(
-                "SELECT filter FROM users WHERE telegram_id = %s",
-                (tg_id,)
-            )
-            row = cur.fetchone()
-            tickers = row[0] or []  # если NULL — получим []
-
-            # 2) Если пользователь указал тикеры — проверяем equality ANY(),
-            #    иначе — отдаем все новости
-            if tickers:
-                cur.execute(
-                    """
-                    SELECT text
-                    FROM news
-                    WHERE ticker = ANY(%s)
-                    ORDER BY id DESC
-                    LIMIT 10
-                    """,
-                    (tickers,)
-                )
-            else:
-                cur.execute(
-                    """
-                    SELECT text
-                    FROM news
-                    ORDER BY id DESC
-                    LIMIT 10
-                    """
-                )
-            rows = cur.fetchall()
-    finally:
-        conn.close()
+    # 1) Фильтр пользователя из кеша профилей; нет пользователя — пустой фильтр
+    profile = user_cache.get(tg_id)
+    tickers = profile["filter"] if profile else []
+
+    # 2) Лента из памяти; пока кеш не прогрет — из БД.
+    #    Новость подходит, если в ней есть хотя бы один тикер фильтра
+    if news_cache.ready:
+        rows = news_cache.latest(tickers, NEWS_LIMIT)
+    else:
+        rows = await fetch_latest(tickers, NEWS_LIMIT)
 
     # 3) Отправляем ответы
     if not rows:
@@ -54,10 +64,11 @@ async def handle_news(callback: types.CallbackQuery):
         )
         return
 
-    for (text,) in rows:
-        await callback.message.answer(text)
-
-    await callback.message.answer(
-        "Это все новости.",
-        reply_markup=main_kb
-    )
\ No newline at end of file
+    # Новости упакованы в минимум сообщений, меню — у последнего
+    messages = compose([row["text"] for row in rows], prefix="📰 ", footer="Это все новости.")
+    for i, text in enumerate(messages):
+        await callback.message.answer(
+            text,
+            parse_mode="HTML",
+            reply_markup=main_kb if i == len(messages) - 1 else None
+        )
\ No newline at end of file
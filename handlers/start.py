@@ -2,10 +2,9 @@ import logging
 from aiogram import Router, types, F
 from aiogram.filters import CommandStart
 from aiogram.fsm.context import FSMContext
-from sqlalchemy.dialects.postgresql import insert
 
 from keyboards.inline import trader_kb, interval_kb, main_kb
-from db.connector import engine, users
+from services.user_cache import user_cache
 from states.start import StartSurvey
 
 router = Router()
@@ -41,20 +40,7 @@ async def process_news_frequency(callback: types.CallbackQuery, state: FSMContex
     data = await state.get_data()
 
     tg_id = callback.from_user.id
-    stmt = insert(users).values(
-        telegram_id=tg_id,
-        trader_type=data["trader_type"],
-        news_interval=data["news_interval"]
-    )
-    upsert = stmt.on_conflict_do_update(
-        index_elements=[users.c.telegram_id],
-        set_={
-            "trader_type": stmt.excluded.trader_type,
-            "news_interval": stmt.excluded.news_interval,
-        }
-    )
-    with engine.begin() as conn:
-        conn.execute(upsert)
+    await user_cache.save_survey(tg_id, data["trader_type"], data["news_interval"])
 
     await state.clear()
     await callback.message.edit_text(
@@ -73,20 +59,7 @@ async def process_custom_interval(message: types.Message, state: FSMContext):
     data = await state.get_data()
 
     tg_id = message.from_user.id
-    stmt = insert(users).values(
-        telegram_id=tg_id,
-        trader_type=data["trader_type"],
-        news_interval=data["news_interval"]
-    )
-    upsert = stmt.on_conflict_do_update(
-        index_elements=[users.c.telegram_id],
-        set_={
-            "trader_type": stmt.excluded.trader_type,
-            "news_interval": stmt.excluded.news_interval,
-        }
-    )
-    with engine.begin() as conn:
-        conn.execute(upsert)
+    await user_cache.save_survey(tg_id, data["trader_type"], data["news_interval"])
 
     await state.clear()
     await message.answer(
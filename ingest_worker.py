@@ -0,0 +1,59 @@
+import asyncio
+import logging
+
+from db import partitions
+from db.connector import DB_CONFIG, NEWS_CHANNEL
+import dbnews
+import prefilter
+import parsing.pars_finam
+import parsing.pars_rbc
+import parsing.pars_rss
+from services.ingestion import IngestionPipeline
+from services.topics import embed_loop
+from utils import metrics
+
+from utils.ticker_map import ticker_lookup
+ticker_list = list(ticker_lookup.values())
+
+DELAY = 60  # секунда
+
+# Источники новостей для конвейера: имя → функция сбора
+SOURCES = {
+    "finam": parsing.pars_finam.collect_set,
+    "rbc":   parsing.pars_rbc.collect_set,
+    "lenta": parsing.pars_rss.collect_set,
+}
+
+
+def build_pipeline(on_persisted=None) -> IngestionPipeline:
+    """
+    Создаёт дедупликатор и конвейер сбора. Каждая записанная новость
+    анонсируется через NOTIFY в NEWS_CHANNEL для процессов бота.
+    """
+    checker = dbnews.DBNewsDeduplicator(DB_CONFIG, notify_channel=NEWS_CHANNEL)
+    logging.info("DBChecker инициализирован")
+    return IngestionPipeline(
+        checker, SOURCES, ticker_lookup, ticker_list,
+        text_filter=prefilter.TextPrefilter(),
+        delay=DELAY,
+        on_persisted=on_persisted,
+    )
+
+
+async def main():
+    # Воркер сбора: парсинг, spaCy, GPT и эмбеддинги — без бота.
+    # Бот (start_bot.py) узнаёт о новых новостях через LISTEN.
+    partitions.prepare_schema()
+    logging.info("Таблицы в БД проверены и созданы, запускаю сбор новостей")
+    await metrics.start_from_env()
+    # воркер — единственный писатель news, он же заводит и архивирует её секции
+    asyncio.create_task(partitions.maintenance_loop())
+    pipeline = build_pipeline()
+    # эмбеддинги тем пользователей считаются здесь же: модель уже загружена
+    asyncio.create_task(embed_loop(pipeline.checker))
+    await pipeline.run()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -12,6 +12,9 @@ filter_kb = InlineKeyboardMarkup(inline_keyboard=[
         InlineKeyboardButton(text="➕ Добавить тикеры", callback_data="add_filter"),
         InlineKeyboardButton(text="👀 Показать тикеры", callback_data="view_filter"),
     ],
+    [
+        InlineKeyboardButton(text="🧠 Темы", callback_data="add_topics"),
+    ],
     [
         InlineKeyboardButton(text="❌ Удалить фильтрацию", callback_data="del_filter"),
         InlineKeyboardButton(text="🔙 Назад", callback_data="back_main"),
@@ -0,0 +1,225 @@
+# Сквозной нагрузочный прогон без внешних сервисов: мок GPT, фейковый Telegram,
+# локальный Postgres. Драйвер заводит N подписчиков, подаёт M статей в минуту
+# в настоящий конвейер сбора и рассылку, а затем считает задержку доставки
+# от публикации статьи до send_message.
+#
+# Прогон пишет пользователей и новости в DB_CONFIG и шлёт NOTIFY о новостях —
+# запускать только на отдельной базе (--dedicated-db).
+#
+#   python -m loadtest.driver --dedicated-db --users 1000 --articles-per-min 60 --duration 300
+import argparse
+import asyncio
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+from aiohttp import web
+
+from loadtest import fake_telegram, mock_gpt
+
+log = logging.getLogger("loadtest")
+
+# telegram_id тестовых пользователей — отрицательные: id пользователей Telegram
+# положительны, поэтому очистка по telegram_id < 0 не заденет настоящих
+USER_ID_BASE = -9_000_000_000
+MARKER_RE = re.compile(r"\[lt:(\d+)\]")
+
+
+class ArticleSource:
+    """Источник для IngestionPipeline: отдаёт статьи с заданной частотой и помнит время публикации."""
+
+    def __init__(self, per_minute: float, seed: int):
+        from benchmarks.synthetic import NewsGenerator
+        self.generator = NewsGenerator(seed=seed)
+        self.interval = 60.0 / per_minute
+        self.next_at = time.time()
+        self.published: dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self) -> set[str]:
+        articles = set()
+        with self._lock:
+            now = time.time()
+            while self.next_at <= now:
+                item = self.generator.next()
+                articles.add(f"{item['raw']} [lt:{item['id']}]")
+                self.published[item["id"]] = now
+                self.next_at += self.interval
+        return articles
+
+
+def seed_users(n: int, seed: int):
+    from db.connector import get_db_connection
+    from utils.ticker_map import ticker_lookup
+
+    rng = random.Random(seed)
+    tickers = sorted(set(ticker_lookup.values()))
+    rows = [
+        (USER_ID_BASE + i, rng.sample(tickers, rng.randint(1, 3)), rng.choice((3, 5, 10)),
+         rng.choice(("short", "medium", "long")), rng.choice((15, 30, 60)))
+        for i in range(n)
+    ]
+    conn = get_db_connection()
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM users WHERE telegram_id < 0")
+            cur.executemany(
+                """
+                INSERT INTO users (telegram_id, filter, noise_tolerance, trader_type, news_interval)
+                VALUES (%s, %s, %s, %s, %s)
+                """,
+                rows,
+            )
+    finally:
+        conn.close()
+
+
+def drop_users():
+    from db.connector import get_db_connection
+    conn = get_db_connection()
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM users WHERE telegram_id < 0")
+    finally:
+        conn.close()
+
+
+async def _serve(app: web.Application, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+def _pct(values: list[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run(args):
+    # 1) Заглушки внешних API
+    deliveries: dict[tuple[int, int], float] = {}
+
+    def on_send(chat_id: int, text: str, ts: float):
+        for marker in MARKER_RE.findall(text):
+            deliveries.setdefault((chat_id, int(marker)), ts)
+
+    gpt_app = mock_gpt.create_app(args.gpt_latency, args.gpt_jitter, args.seed)
+    tg_app = fake_telegram.create_app(args.tg_rate_limit, on_send)
+    runners = [await _serve(gpt_app, args.gpt_port), await _serve(tg_app, args.tg_port)]
+
+    # gpt.py читает API_BASE при импорте — выставляем до импорта конвейера
+    os.environ["API_BASE"] = f"http://127.0.0.1:{args.gpt_port}"
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from db import pool
+    from db import partitions
+    from db.connector import DB_CONFIG, NEWS_CHANNEL
+    import dbnews
+    import prefilter
+    from services.ingestion import IngestionPipeline
+    from services.news_dispatcher import news_dispatcher_task
+    from services.news_cache import news_cache
+    from services.send_engine import send_engine
+    from services.user_cache import user_cache
+    from utils.ticker_map import ticker_lookup
+
+    partitions.prepare_schema()
+    seed_users(args.users, args.seed)
+    log.info("Заведено пользователей: %d", args.users)
+    await pool.init_pool()
+    await user_cache.load()
+    await news_cache.warm()
+
+    # 2) Настоящие конвейер и рассылка, направленные на заглушки
+    source = ArticleSource(args.articles_per_min, args.seed)
+    news_ready = asyncio.Event()
+
+    def on_persisted(records):
+        news_cache.add(records)
+        news_ready.set()
+
+    pipeline = IngestionPipeline(
+        dbnews.DBNewsDeduplicator(DB_CONFIG, notify_channel=NEWS_CHANNEL),
+        {"loadtest": source},
+        ticker_lookup, list(ticker_lookup.values()),
+        text_filter=prefilter.TextPrefilter(),
+        delay=1,
+        on_persisted=on_persisted,
+    )
+    session = AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{args.tg_port}"))
+    bot = Bot(token="42:loadtest", session=session)
+    await send_engine.start(bot)
+
+    tasks = [
+        asyncio.create_task(pipeline.run()),
+        asyncio.create_task(news_dispatcher_task(bot, news_ready)),
+    ]
+    started = time.time()
+    try:
+        while time.time() - started < args.duration:
+            await asyncio.sleep(10)
+            log.info("опубликовано %d, доставок %d, очереди %s, отправка %s",
+                     len(source.published), len(deliveries), pipeline.queue_depths(),
+                     send_engine.queue_depths())
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await send_engine.stop(drain=0)
+        await session.close()
+        await pool.close_pool()
+        for runner in runners:
+            await runner.cleanup()
+        if not args.keep_users:
+            drop_users()
+
+    # 3) Отчёт: задержка первой доставки статьи каждому получателю
+    latencies = [ts - source.published[marker]
+                 for (chat_id, marker), ts in deliveries.items()
+                 if marker in source.published]
+    delivered_articles = {marker for _, marker in deliveries}
+    print()
+    print(f"пользователей:            {args.users}")
+    print(f"статей опубликовано:      {len(source.published)} ({args.articles_per_min}/мин)")
+    print(f"статей доставлено:        {len(delivered_articles)}")
+    print(f"доставок (чат × статья):  {len(deliveries)}")
+    print(f"sendMessage всего:        {tg_app['stats']['sent']}, отклонено 429: {tg_app['stats']['throttled']}")
+    print(f"запросов к GPT:           {gpt_app['stats']['posted']}")
+    for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1.0)):
+        print(f"задержка доставки {name}:   {_pct(latencies, q):.2f} с")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сквозной нагрузочный тест сбора и рассылки")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--articles-per-min", type=float, default=30)
+    parser.add_argument("--duration", type=float, default=300, help="длительность прогона, с")
+    parser.add_argument("--gpt-latency", type=float, default=2.0)
+    parser.add_argument("--gpt-jitter", type=float, default=0.5)
+    parser.add_argument("--tg-rate-limit", type=int, default=30, help="лимит фейкового Telegram, сообщений/с")
+    parser.add_argument("--gpt-port", type=int, default=8081)
+    parser.add_argument("--tg-port", type=int, default=8082)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--keep-users", action="store_true", help="не удалять тестовых пользователей")
+    parser.add_argument("--dedicated-db", action="store_true",
+                        help="подтверждение, что DB_CONFIG указывает на отдельную базу для нагрузочных прогонов")
+    args = parser.parse_args()
+    if not args.dedicated_db:
+        raise SystemExit("Прогон пишет в DB_CONFIG тестовых пользователей и новости: "
+                         "запускайте на отдельной базе с --dedicated-db")
+    if USER_ID_BASE + args.users > 0:
+        raise SystemExit(f"--users больше {-USER_ID_BASE}: тестовые telegram_id должны быть отрицательными")
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# Локальный Telegram Bot API для aiogram: принимает sendMessage и запоминает,
+# кому и когда ушло сообщение. Умеет имитировать лимит Telegram (429 + retry_after).
+#
+#   python -m loadtest.fake_telegram --port 8082 --rate-limit 30
+#   бот: Bot(token, session=AiohttpSession(api=TelegramAPIServer.from_base("http://127.0.0.1:8082")))
+import argparse
+import asyncio
+import time
+
+from aiohttp import web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "LoadTestBot", "username": "loadtest_bot"}
+
+
+def create_app(rate_limit: int = 0, on_send=None) -> web.Application:
+    """
+    rate_limit — сколько sendMessage в секунду пропускать (0 — без лимита).
+    on_send(chat_id, text, ts) вызывается на каждое принятое сообщение.
+    """
+    sent: list[tuple[int, str, float]] = []
+    window = {"second": 0, "count": 0}
+    stats = {"sent": 0, "throttled": 0, "other_calls": 0}
+
+    async def call(request):
+        method = request.match_info["method"]
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+
+        if method == "getMe":
+            return web.json_response({"ok": True, "result": BOT_USER})
+
+        if method == "getUpdates":
+            # long polling: обновлений нет, держим соединение как настоящий сервер
+            await asyncio.sleep(min(float(params.get("timeout") or 0), 10))
+            return web.json_response({"ok": True, "result": []})
+
+        if method == "sendMessage":
+            now = time.time()
+            if rate_limit:
+                second = int(now)
+                if window["second"] != second:
+                    window.update(second=second, count=0)
+                window["count"] += 1
+                if window["count"] > rate_limit:
+                    stats["throttled"] += 1
+                    return web.json_response({
+                        "ok": False,
+                        "error_code": 429,
+                        "description": "Too Many Requests: retry after 1",
+                        "parameters": {"retry_after": 1},
+                    }, status=429)
+
+            chat_id = int(params["chat_id"])
+            text = params.get("text", "")
+            sent.append((chat_id, text, now))
+            stats["sent"] += 1
+            if on_send is not None:
+                on_send(chat_id, text, now)
+            return web.json_response({"ok": True, "result": {
+                "message_id": len(sent),
+                "date": int(now),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": BOT_USER,
+                "text": text,
+            }})
+
+        # deleteWebhook, answerCallbackQuery, editMessageText и т.п.
+        stats["other_calls"] += 1
+        return web.json_response({"ok": True, "result": True})
+
+    async def get_stats(request):
+        return web.json_response(stats)
+
+    app = web.Application()
+    app["sent"] = sent
+    app["stats"] = stats
+    app.router.add_route("*", "/bot{token}/{method}", call)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Фейковый Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--rate-limit", type=int, default=0, help="sendMessage в секунду, 0 — без лимита")
+    args = parser.parse_args()
+    web.run_app(create_app(args.rate_limit), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# Локальная замена GPT API из gpt.py: PostNewRequest / GetNewResponse / CompleteSession.
+# Ответ готов через latency ± jitter секунд после PostNewRequest; до этого
+# GetNewResponse возвращает пустой data, как настоящий сервис.
+#
+#   python -m loadtest.mock_gpt --port 8081 --latency 2 --jitter 0.5
+#   API_BASE=http://127.0.0.1:8081 python ingest_worker.py
+import argparse
+import json
+import random
+import re
+import time
+
+from aiohttp import web
+
+from utils.ticker_map import ticker_lookup
+
+# Маркер, по которому драйвер нагрузки сопоставляет новость и доставку
+MARKER_RE = re.compile(r"\[lt:\d+\]")
+
+
+def _fake_reply(message: str, rng: random.Random) -> str:
+    # текст новости идёт после первой строки промпта
+    body = message.split("\n", 1)[1] if "\n" in message else message
+    lower = body.lower()
+    orgs = [name for name in ticker_lookup if name in lower]
+    first_sentence = body.strip().split(". ")[0].strip(" .") + "."
+    marker = MARKER_RE.search(body)
+    if marker and marker.group(0) not in first_sentence:
+        first_sentence = f"{first_sentence} {marker.group(0)}"
+    intensity = rng.randint(1, 10)
+    polarity = "positive" if intensity > 6 else "negative" if intensity < 4 else "neutral"
+    reply = {
+        "tickers": [],
+        "organizations": orgs,
+        "compressed_message": first_sentence,
+        "polarity": polarity,
+        "intensity": intensity,
+    }
+    return "Вот результат:\n" + json.dumps(reply, ensure_ascii=False)
+
+
+def create_app(latency: float = 2.0, jitter: float = 0.5, seed: int = 0) -> web.Application:
+    rng = random.Random(seed)
+    dialogs: dict[str, dict] = {}
+    stats = {"posted": 0, "polled": 0, "completed": 0}
+
+    async def post_new_request(request):
+        payload = await request.json()
+        delay = max(0.0, latency + rng.uniform(-jitter, jitter))
+        dialogs[payload["dialogIdentifier"]] = {
+            "ready_at": time.monotonic() + delay,
+            "reply": _fake_reply(payload.get("Message", ""), rng),
+        }
+        stats["posted"] += 1
+        return web.json_response({"success": True})
+
+    async def get_new_response(request):
+        payload = await request.json()
+        stats["polled"] += 1
+        dialog = dialogs.get(payload["dialogIdentifier"])
+        if dialog is None or time.monotonic() < dialog["ready_at"]:
+            return web.json_response({"success": True, "data": None})
+        return web.json_response({"success": True, "data": {"lastMessage": dialog["reply"]}})
+
+    async def complete_session(request):
+        payload = await request.json()
+        dialogs.pop(payload["dialogIdentifier"], None)
+        stats["completed"] += 1
+        return web.json_response({"success": True})
+
+    async def get_stats(request):
+        return web.json_response({**stats, "open_dialogs": len(dialogs)})
+
+    app = web.Application()
+    app["stats"] = stats
+    app.router.add_post("/PostNewRequest", post_new_request)
+    app.router.add_post("/GetNewResponse", get_new_response)
+    app.router.add_post("/CompleteSession", complete_session)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Мок GPT API для нагрузочных тестов")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=2.0, help="среднее время ответа, с")
+    parser.add_argument("--jitter", type=float, default=0.5, help="разброс времени ответа, с")
+    args = parser.parse_args()
+    web.run_app(create_app(args.latency, args.jitter), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
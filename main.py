@@ -2,75 +2,89 @@ import asyncio
 import logging
 
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 
 from config import BOT_TOKEN
-from db.connector import engine, metadata
-import dbnews
-import parsing.pars_finam
-import parsing.pars_rbc
-import parsing.pars_rss
-import data_refactor
+from db import partitions, pool
+from db.connector import TOPICS_CHANNEL, USERS_CHANNEL
+from db.fsm_storage import create_storage, fsm_cache_middleware
+from db.listener import listen
+from ingest_worker import build_pipeline
+from services.news_dispatcher import news_dispatcher_task
+from services.news_cache import news_cache
+from services.bot_runner import run_bot
+from services.scheduler import setup_scheduler
+from services.send_engine import send_engine
+from services.topics import embed_loop, topic_index
+from services.urgent_alerts import urgent_alerts
+from services.user_cache import user_cache
+from utils import metrics
 
 from handlers.start        import router as start_router
 from handlers.news         import router as news_router
 from handlers.filter_menu  import router as filter_router
 
-from utils.ticker_map import ticker_lookup
-ticker_list = list(ticker_lookup.values())
-
-db_config = {
-    "dbname":   "postgres",
-    "user":     "_enter_",
-    "password": "1234",
-    "host":     "localhost",
-    "port":     5432,
-}
-
-DELAY = 60  # секунда
-
 logging.basicConfig(level=logging.INFO)
 
 bot = Bot(token=BOT_TOKEN)
-dp  = Dispatcher(storage=MemoryStorage())
+dp  = Dispatcher(storage=create_storage())  # FSM_STORAGE=postgres — общее для реплик
+dp.update.outer_middleware(fsm_cache_middleware)
 
 # Регистрируем роутеры
 dp.include_router(start_router)
 dp.include_router(news_router)
 dp.include_router(filter_router)
 
-async def parser_loop(checker: dbnews.DBNewsDeduplicator):
-    """Фоновый цикл сбора и добавления новостей"""
-    while True:
-        try:
-            articles = parsing.pars_finam.collect_set()
-            print(len(articles))
-            articles.update(parsing.pars_rbc.collect_set())
-            print(len(articles))
-            articles.update(parsing.pars_rss.collect_set())
-            print(len(articles))
-            data_refactor.add_news(checker, articles, ticker_lookup, ticker_list)
-            data_refactor.print_news(checker)
-            logging.info("Новости обновлены")
-        except Exception as err:
-            logging.error(f"Ошибка парсинга: {err}")
-        await asyncio.sleep(DELAY)
-
 async def main():
     # 1) Создаём таблицы
-    metadata.create_all(engine)
+    partitions.prepare_schema()
     logging.info("✅ Таблицы проверены и созданы")
+    await metrics.start_from_env()
+    await pool.init_pool()
+    await user_cache.load()
+    await topic_index.load()
+    await news_cache.warm()
+    await send_engine.start(bot)
+    # срочные новости уходят сразу, как только попадают в кеш
+    news_cache.listeners.append(urgent_alerts.on_news)
+    # дайджест в 9:00 и оповещения о начале и конце торгов
+    scheduler = setup_scheduler(bot)
+    scheduler.start()
+    # профили и темы могут меняться и другими процессами бота (start_bot.py)
+    def on_notify(channel, payload):
+        if channel == USERS_CHANNEL:
+            user_cache.on_notify(channel, payload)
+        else:
+            topic_index.on_notify(channel, payload)
+
+    def on_connect():
+        user_cache.on_reconnect()
+        topic_index.on_reconnect()
+
+    asyncio.create_task(listen([USERS_CHANNEL, TOPICS_CHANNEL], on_notify, on_connect=on_connect))
+
+    # 2) Запускаем конвейер сбора новостей и рассылку в одном процессе.
+    #    Для раздельного запуска: ingest_worker.py + start_bot.py
+    news_ready = asyncio.Event()
 
-    # 2) Инициализируем дедупликатор
-    checker = dbnews.DBNewsDeduplicator(db_config)
-    logging.info("DBChecker инициализирован")
+    def on_persisted(records):
+        news_cache.add(records)
+        news_ready.set()
 
-    # 3) Запускаем фон-задачу парсинга
-    asyncio.create_task(parser_loop(checker))
+    pipeline = build_pipeline(on_persisted=on_persisted)
+    asyncio.create_task(pipeline.run())
+    asyncio.create_task(partitions.maintenance_loop())
+    # эмбеддинги новых тем пользователей — той же моделью, что у дедупликатора
+    asyncio.create_task(embed_loop(pipeline.checker))
+    asyncio.create_task(news_dispatcher_task(bot, news_ready))
 
-    # 4) Запускаем бота
+    # 3) Запускаем бота: long polling или webhook (BOT_MODE)
     logging.info("Запускаю бота…")
-    await dp.start_polling(bot)
+    try:
+        await run_bot(bot, dp)
+    finally:
+        scheduler.shutdown(wait=False)
+        await send_engine.stop()
+        await pool.close_pool()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
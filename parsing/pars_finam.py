@@ -10,6 +10,8 @@ from bs4 import BeautifulSoup
 import feedparser
 import requests
 
+from utils import metrics
+
 
 url = "https://www.finam.ru/analysis/conews/rsspoint/"
 MAX_ITEMS = 3
@@ -19,6 +21,7 @@ JSON_FILE = Path("news_finam.json")
 locale.setlocale(locale.LC_TIME, "C")
 
 MOSCOW_TZ = timezone(timedelta(hours=3))
+HTML_SECONDS = metrics.histogram("html_extract_seconds", "Разбор HTML статьи", ("source",))
 
 def get_resp(url: str) -> str:
     resp = requests.get(url)
@@ -29,6 +32,7 @@ def get_xml_dict(xml_str: str) -> dict:
     feed = feedparser.parse(xml_str)
     return feed
 
+@HTML_SECONDS.time(source="finam")
 def clean_html(raw: str) -> str:
     text = BeautifulSoup(raw, "lxml").get_text(" ", strip=True)
     return html.unescape(text)
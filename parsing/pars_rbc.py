@@ -8,11 +8,14 @@ import time
 import requests
 from bs4 import BeautifulSoup
 
+from utils import metrics
+
 BASE_URL = "https://quote.rbc.ru"
 DELAY = 60
 HEADERS = {"User-Agent": "Mozilla/5.0 (headline-bot/1.0)"}
 HEADLINE_SEL = "span.q-item__title.js-rm-central-column-item-text"
 TIME_SELECTORS = ("time", "span.article__data-time", "span.article__header__date")
+HTML_SECONDS = metrics.histogram("html_extract_seconds", "Разбор HTML статьи", ("source",))
 
 # Множество для хранения описаний (уникальных текстов статей)
 descriptions = set()
@@ -30,12 +33,14 @@ def iter_headline_links(html: str) -> Iterator[tuple[str, str]]:
             yield span.get_text(strip=True), urllib.parse.urljoin(BASE_URL, a["href"])
 
 def parse_article(url: str) -> str:
-    soup = BeautifulSoup(req(url), "lxml")
-    body = soup.select_one("div.article__text")
-    if body:
-        text = body.get_text(" ", strip=True).replace("\u00A0", " ")
-    else:
-        text = "\n".join(p.get_text(" ", strip=True) for p in soup.find_all("p")).strip()
+    html = req(url)
+    with HTML_SECONDS.time(source="rbc"):
+        soup = BeautifulSoup(html, "lxml")
+        body = soup.select_one("div.article__text")
+        if body:
+            text = body.get_text(" ", strip=True).replace("\u00A0", " ")
+        else:
+            text = "\n".join(p.get_text(" ", strip=True) for p in soup.find_all("p")).strip()
     return text
 
 def collect_set():
@@ -8,11 +8,14 @@ import feedparser
 import requests
 from bs4 import BeautifulSoup
 
+from utils import metrics
+
 SRC_RSS_URL = "https://lenta.ru/rss/news/economics"
 OUT_FILE = Path("lenta_economics.xml")
 MAX_ITEMS = 5
 delay = 60
 JSON_FILE = Path("news_rss.json")
+HTML_SECONDS = metrics.histogram("html_extract_seconds", "Разбор HTML статьи", ("source",))
 
 def fed_pars(url: str) -> dict:
     resp = requests.get(url, timeout=10, headers={"User-Agent": "rss-bot/1.0"})
@@ -47,12 +50,13 @@ def get_article_text(url: str) -> str:
     try:
         url_txt = requests.get(url, timeout=10)
         url_txt.raise_for_status()
-        soup = BeautifulSoup(url_txt.text, "lxml")
-        content = soup.find("div", class_="topic-body__content")
-        if not content:
-            return "[Не удалось найти текст статьи]"
-        paragraphs = content.find_all("p", class_="topic-body__content-text")
-        text = "\n".join(p.get_text(strip=True) for p in paragraphs)
+        with HTML_SECONDS.time(source="lenta"):
+            soup = BeautifulSoup(url_txt.text, "lxml")
+            content = soup.find("div", class_="topic-body__content")
+            if not content:
+                return "[Не удалось найти текст статьи]"
+            paragraphs = content.find_all("p", class_="topic-body__content-text")
+            text = "\n".join(p.get_text(strip=True) for p in paragraphs)
         return text.replace("\u00A0", " ").strip()
     except Exception as e:
         return f"[Ошибка при парсинге: {e}]"
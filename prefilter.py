@@ -0,0 +1,193 @@
+import hashlib
+import re
+import unicodedata
+from collections import deque
+
+import numpy as np
+
+from utils import metrics
+
+# Агентства/издания, чьи подписи часто висят в конце перепечаток
+CREDIT_SOURCES = (
+    "интерфакс", "тасс", "риа новости", "прайм", "рбк", "финам", "коммерсантъ",
+    "ведомости", "известия", "лента.ру", "lenta.ru", "reuters", "bloomberg",
+)
+_SOURCES_RE = "|".join(re.escape(s) for s in CREDIT_SOURCES)
+
+_TRAILING_CREDIT_RES = (
+    # «... — Интерфакс.», «... (ТАСС)»
+    re.compile(rf"\s*(?:[—–-]\s*|\(\s*)(?:{_SOURCES_RE})\s*\)?\s*\.?$"),
+    # «... Источник: РБК», «... Фото: ТАСС» — отдельным последним предложением
+    re.compile(r"(?<=[.!?])\s*(?:источник|фото|читайте также)\s*:\s*[^.!?]{0,60}[.!?]?$"),
+)
+_QUOTES_RE = re.compile(r"[«»“”„‟\"'`’‘‚]")
+_DASHES_RE = re.compile(r"[‐‑‒–—―]")
+_SPACES_RE = re.compile(r"\s+")
+_WORD_RE = re.compile(r"\w+")
+
+PREFILTER_CHECKS = metrics.counter("prefilter_checks_total", "Проверки префильтра по исходу", ("result",))
+
+
+def normalize_text(text: str) -> str:
+    """
+    Приводит текст к канонической форме для точного сравнения:
+    регистр, ё→е, кавычки, тире, пробелы и хвостовая подпись источника.
+    """
+    text = unicodedata.normalize("NFKC", text).lower().replace("ё", "е")
+    text = _QUOTES_RE.sub("", text)
+    text = _DASHES_RE.sub("-", text)
+    text = _SPACES_RE.sub(" ", text).strip()
+    for credit_re in _TRAILING_CREDIT_RES:
+        text = credit_re.sub("", text)
+    return text.strip(" .,;:-")
+
+
+def _hash64(tokens: list[str]) -> np.ndarray:
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(t.encode("utf-8"), digest_size=8).digest(), "big")
+         for t in tokens],
+        dtype=">u8",
+    )
+
+
+def simhash64(text: str) -> int:
+    """64-битный SimHash по словам и словным биграммам нормализованного текста."""
+    words = _WORD_RE.findall(text)
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    if not features:
+        return 0
+    # (n, 64) матрица битов: +1 за установленный бит, -1 за сброшенный
+    bits = np.unpackbits(_hash64(features).view(np.uint8)).reshape(-1, 64)
+    weights = bits.sum(axis=0, dtype=np.int64) * 2 - len(features)
+    fingerprint = 0
+    for bit in np.packbits(weights > 0):
+        fingerprint = (fingerprint << 8) | int(bit)
+    return fingerprint
+
+
+class TextPrefilter:
+    """
+    Дешёвый первый уровень дедупликации, до детекции тикеров, GPT и эмбеддингов.
+    Отсекает точные копии (хеш нормализованного текста) и почти точные
+    (SimHash с расстоянием Хэмминга ≤ max_distance). Всё, что дальше, —
+    «неочевидное» и уходит в семантический уровень (DBNewsDeduplicator).
+    """
+
+    def __init__(self,
+                 max_distance: int = 3,   # порог Хэмминга для SimHash; больше → агрессивнее
+                 min_tokens: int = 8,     # короче — SimHash ненадёжен, проверяем только точный хеш
+                 capacity: int = 100_000  # сколько последних текстов помнить (FIFO)
+                 ):
+        self.max_distance = max_distance
+        self.min_tokens = min_tokens
+        self.capacity = capacity
+
+        # Принцип Дирихле: при ≤ k отличающихся битах хотя бы один из k+1 блоков совпадает
+        self.n_blocks = max_distance + 1
+        self.block_bits = 64 // self.n_blocks
+        self.block_mask = (1 << self.block_bits) - 1
+
+        self.exact: dict[bytes, int] = {}                     # хеш → кол-во вхождений в окне
+        self.fingerprints: dict[int, int] = {}                # SimHash → кол-во вхождений в окне
+        self.blocks: list[dict[int, set[int]]] = [{} for _ in range(self.n_blocks)]
+        self.history: deque[tuple[bytes, int | None]] = deque()
+        self.pending: set[bytes] = set()                      # хеши текстов в обработке (check → remember/release)
+
+    def _block_keys(self, fp: int):
+        for i in range(self.n_blocks):
+            yield i, (fp >> (i * self.block_bits)) & self.block_mask
+
+    def _near(self, fp: int) -> bool:
+        for i, key in self._block_keys(fp):
+            for other in self.blocks[i].get(key, ()):
+                if (fp ^ other).bit_count() <= self.max_distance:
+                    return True
+        return False
+
+    def _index(self, fp: int):
+        self.fingerprints[fp] = self.fingerprints.get(fp, 0) + 1
+        for i, key in self._block_keys(fp):
+            self.blocks[i].setdefault(key, set()).add(fp)
+
+    def _unindex(self, fp: int):
+        self.fingerprints[fp] -= 1
+        if self.fingerprints[fp]:
+            return
+        del self.fingerprints[fp]
+        for i, key in self._block_keys(fp):
+            bucket = self.blocks[i][key]
+            bucket.discard(fp)
+            if not bucket:
+                del self.blocks[i][key]
+
+    def _remember(self, digest: bytes, fp: int | None):
+        self.exact[digest] = self.exact.get(digest, 0) + 1
+        if fp is not None:
+            self._index(fp)
+        self.history.append((digest, fp))
+
+        while len(self.history) > self.capacity:
+            self._forget(*self.history.popleft())
+
+    def _forget(self, digest: bytes, fp: int | None):
+        self.exact[digest] -= 1
+        if not self.exact[digest]:
+            del self.exact[digest]
+        if fp is not None:
+            self._unindex(fp)
+
+    def check(self, text: str) -> tuple[bytes, int | None] | None:
+        """
+        Ключ текста, если текст новый; None — если это точный или почти
+        точный дубликат уже виденного или ещё обрабатываемого текста.
+
+        Новый текст резервируется: его копии отсекаются, пока он идёт через
+        GPT и дедупликацию. Дальше ключ либо remember() — судьба статьи
+        решена, либо release() — GPT не ответил, и следующая копия пройдёт.
+        """
+        norm = normalize_text(text)
+        digest = hashlib.blake2b(norm.encode("utf-8"), digest_size=16).digest()
+        if digest in self.exact or digest in self.pending:
+            PREFILTER_CHECKS.inc(result="exact")
+            return None
+
+        fp = None
+        if len(_WORD_RE.findall(norm)) >= self.min_tokens:
+            fp = simhash64(norm)
+            if self._near(fp):
+                PREFILTER_CHECKS.inc(result="near")
+                return None
+
+        PREFILTER_CHECKS.inc(result="unique")
+        self.pending.add(digest)
+        if fp is not None:
+            self._index(fp)
+        return digest, fp
+
+    def remember(self, key: tuple[bytes, int | None]):
+        """Запоминает зарезервированный check() текст."""
+        self.release(key)
+        self._remember(*key)
+
+    def release(self, key: tuple[bytes, int | None]):
+        """Снимает резерв check(): текст не запоминается, его копия пройдёт снова."""
+        digest, fp = key
+        if digest not in self.pending:
+            return
+        self.pending.discard(digest)
+        if fp is not None:
+            self._unindex(fp)
+
+    def add_news(self, text: str) -> bool:
+        """
+        Возвращает True, если текст новый (и запоминает его),
+        False — если это точный или почти точный дубликат уже виденного.
+        """
+        key = self.check(text)
+        if key is None:
+            return False
+        self.remember(key)
+        return True
+
+    def __len__(self) -> int:
+        return len(self.history)
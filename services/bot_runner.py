@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import os
+import signal
+
+from aiogram import Bot, Dispatcher
+
+from db import pool
+from services.send_engine import send_engine
+from services.user_cache import user_cache
+
+log = logging.getLogger(__name__)
+
+BOT_MODE = os.getenv("BOT_MODE", "polling")                      # polling | webhook
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")                           # публичный https-адрес; без него setWebhook не вызывается
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")                     # X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")            # слушаем за локальным reverse proxy
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+SHUTDOWN_GRACE = float(os.getenv("WEBHOOK_SHUTDOWN_GRACE", "5"))  # секунд /readyz отдаёт 503 до остановки
+
+
+def is_ready() -> bool:
+    """Процесс готов принимать апдейты: пул БД открыт, профили загружены, очередь отправки работает."""
+    try:
+        pool.get_pool()
+    except RuntimeError:
+        return False
+    return user_cache.loaded and send_engine.bot is not None
+
+
+async def run_bot(bot: Bot, dp: Dispatcher):
+    """Получает апдейты в режиме BOT_MODE до остановки процесса."""
+    if BOT_MODE == "polling":
+        await dp.start_polling(bot)
+    elif BOT_MODE == "webhook":
+        await run_webhook(bot, dp)
+    else:
+        raise RuntimeError(f"Неизвестный BOT_MODE={BOT_MODE!r}: ожидается polling или webhook")
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    """
+    Встроенный aiohttp-сервер для webhook Telegram.
+
+    Апдейт проверяется по секретному токену и обрабатывается в фоне
+    (handle_in_background): Telegram сразу получает 200, а хендлеры разных
+    апдейтов идут параллельно. Несколько реплик могут стоять за одним
+    reverse proxy — setWebhook идемпотентен, и при остановке реплика его не снимает.
+
+    /healthz — процесс жив, /readyz — готов принимать апдейты.
+    По SIGTERM/SIGINT /readyz сначала отдаёт 503 (прокси перестаёт слать
+    трафик), затем сервер дожидается текущих запросов и останавливается.
+    """
+    from aiohttp import web
+    from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+    if not WEBHOOK_SECRET:
+        raise RuntimeError("BOT_MODE=webhook требует WEBHOOK_SECRET")
+
+    stopping = asyncio.Event()
+
+    async def healthz(request):
+        return web.Response(text="ok")
+
+    async def readyz(request):
+        if stopping.is_set() or not is_ready():
+            return web.Response(status=503, text="not ready")
+        return web.Response(text="ready")
+
+    app = web.Application()
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/readyz", readyz)
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=WEBHOOK_SECRET,
+        handle_in_background=True,
+    ).register(app, path=WEBHOOK_PATH)
+    # startup/shutdown хуки диспетчера вызываются вместе с приложением
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+    log.info("Webhook слушает http://%s:%d%s", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+
+    if WEBHOOK_URL:
+        await bot.set_webhook(
+            WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopping.set)
+    try:
+        await stopping.wait()
+        log.info("Остановка webhook: ждём %.0f с, пока прокси снимет реплику", SHUTDOWN_GRACE)
+        await asyncio.sleep(SHUTDOWN_GRACE)
+    finally:
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.remove_signal_handler(sig)
+        # SimpleRequestHandler закрывает bot.session в on_shutdown приложения;
+        # send_engine после этого ещё досылает очередь — aiogram откроет сессию заново
+        await runner.cleanup()
@@ -0,0 +1,89 @@
+import heapq
+import random
+import time
+from typing import Callable
+
+SPREAD = 60.0   # первая доставка пользователя сдвигается на его фазу в пределах SPREAD секунд
+JITTER = 5.0    # и ещё на случайные 0..JITTER секунд при каждом планировании
+PRUNE_MIN = 10_000  # с какого размера _next_allowed чистится от истёкших записей
+
+
+class DeliveryScheduler:
+    """
+    Очередь доставки по news_interval пользователей.
+
+    Новые новости копятся в пачке пользователя (не больше noise_tolerance
+    самых свежих), а сам пользователь попадает в кучу со временем, когда
+    ему можно писать: не раньше чем через news_interval минут после прошлой
+    отправки. pop_due() снимает с кучи только наступившие — такт стоит
+    O(due · log n), а не O(всех пользователей).
+
+    Чтобы свежая новость популярного тикера не будила тысячи чатов в одну
+    секунду, у каждого пользователя своя стабильная фаза в пределах spread
+    плюс небольшой случайный jitter.
+    """
+
+    def __init__(self, spread: float = SPREAD, jitter: float = JITTER,
+                 clock: Callable[[], float] = time.monotonic):
+        self.spread = spread
+        self.jitter = jitter
+        self.clock = clock
+        self._heap: list[tuple[float, int]] = []
+        self._due_at: dict[int, float] = {}        # пользователь → запланированное время
+        self._pending: dict[int, list[dict]] = {}  # пользователь → пачка новостей
+        self._next_allowed: dict[int, float] = {}  # пользователь → когда можно писать снова
+        self._prune_at = PRUNE_MIN
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def _phase(self, tg_id: int) -> float:
+        # мультипликативный хеш Кнута: фазы соседних id разнесены по всему интервалу
+        return (tg_id * 2654435761 % 2 ** 32) / 2 ** 32 * self.spread
+
+    def add(self, tg_id: int, items: list[dict], limit: int):
+        """Добавляет новости в пачку пользователя и планирует его, если ещё не запланирован."""
+        batch = self._pending.setdefault(tg_id, [])
+        batch.extend(items)
+        del batch[:-limit]
+        if tg_id in self._due_at:
+            return
+        now = self.clock()
+        due = max(now + self._phase(tg_id), self._next_allowed.pop(tg_id, 0.0))
+        due += random.uniform(0, self.jitter)
+        self._due_at[tg_id] = due
+        heapq.heappush(self._heap, (due, tg_id))
+
+    def pop_due(self) -> list[tuple[int, list[dict]]]:
+        """Пользователи, чьё время наступило, с их пачками."""
+        now = self.clock()
+        result = []
+        while self._heap and self._heap[0][0] <= now:
+            due, tg_id = heapq.heappop(self._heap)
+            if self._due_at.get(tg_id) != due:
+                continue  # устаревшая запись
+            del self._due_at[tg_id]
+            items = self._pending.pop(tg_id, [])
+            if items:
+                result.append((tg_id, items))
+        return result
+
+    def mark_sent(self, tg_id: int, interval_minutes: int | None):
+        now = self.clock()
+        if interval_minutes:
+            self._next_allowed[tg_id] = now + interval_minutes * 60
+        else:
+            self._next_allowed.pop(tg_id, None)
+        if len(self._next_allowed) > self._prune_at:
+            # истёкшая запись ничего не ограничивает, а без новых новостей
+            # пользователь не попадёт в add() и сам её не снимет
+            self._next_allowed = {u: t for u, t in self._next_allowed.items() if t > now}
+            self._prune_at = max(PRUNE_MIN, 2 * len(self._next_allowed))
+
+    def next_due_in(self) -> float | None:
+        """Через сколько секунд наступит ближайшая доставка (None — очередь пуста)."""
+        while self._heap and self._due_at.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - self.clock())
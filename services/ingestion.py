@@ -0,0 +1,261 @@
+import asyncio
+import logging
+import re
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable, Iterable
+
+from detect_tickers import detect_tickers
+from data_refactor import enrich_news
+from utils import metrics
+
+log = logging.getLogger(__name__)
+
+# Стадии конвейера в порядке прохождения новости
+STAGES = ("fetch", "clean", "detect", "enrich", "dedup", "persist")
+
+# Число воркеров на стадию. enrich — ожидание GPT, поэтому воркеров много;
+# detect и dedup — CPU (spaCy, эмбеддинги).
+DEFAULT_WORKERS = {
+    "fetch": 3,
+    "clean": 1,
+    "detect": 2,
+    "enrich": 8,
+    "dedup": 2,
+    "persist": 1,
+}
+QUEUE_SIZE = 100   # ёмкость очереди между стадиями; при заполнении предыдущая стадия ждёт
+DELAY = 60         # пауза между циклами опроса источников, секунды
+PERSIST_BATCH = 50        # новостей на одну транзакцию записи
+PERSIST_INTERVAL = 2.0    # сколько секунд первая новость пачки может ждать остальных
+
+_SPACES_RE = re.compile(r"\s+")
+# pars_rss возвращает описание ошибки вместо текста статьи
+_PARSER_ERRORS = ("[Ошибка при парсинге", "[Не удалось найти текст статьи]")
+
+FETCH_SECONDS = metrics.histogram("ingest_fetch_seconds", "Время сбора новостей из источника", ("source",))
+FETCHED = metrics.counter("ingest_fetched_total", "Новостей получено из источника", ("source",))
+STAGE_SECONDS = metrics.histogram("ingest_stage_seconds", "Время обработки новости стадией", ("stage",))
+STAGE_ITEMS = metrics.counter("ingest_stage_items_total", "Новостей через стадию по исходу", ("stage", "result"))
+QUEUE_DEPTH = metrics.gauge("ingest_queue_depth", "Длина очереди на входе стадии", ("stage",))
+
+
+class IngestionPipeline:
+    """
+    Конвейер сбора новостей: fetch → clean → detect → enrich → dedup → persist.
+    Стадии связаны ограниченными asyncio.Queue, так что ожидание GPT по одной
+    новости перекрывается детекцией тикеров и эмбеддингами других, а при
+    зависании GPT очереди заполняются и сбор останавливается, не раздувая память.
+    Блокирующая работа уходит в пулы: io_executor — сеть и БД,
+    cpu_executor — detect_tickers (можно передать ProcessPoolExecutor).
+    """
+
+    def __init__(self,
+                 checker,                                   # DBNewsDeduplicator
+                 sources: dict[str, Callable[[], Iterable[str]]],  # имя → функция сбора (collect_set)
+                 ticker_lookup: dict[str, str],
+                 ticker_list: list[str],
+                 text_filter=None,                          # prefilter.TextPrefilter
+                 workers: dict[str, int] | None = None,
+                 queue_size: int = QUEUE_SIZE,
+                 delay: float = DELAY,
+                 cpu_executor: Executor | None = None,
+                 io_executor: Executor | None = None,
+                 persist_batch: int = PERSIST_BATCH,
+                 persist_interval: float = PERSIST_INTERVAL,
+                 on_persisted: Callable[[list[dict]], None] | None = None):
+        self.checker = checker
+        self.sources = sources
+        self.ticker_lookup = ticker_lookup
+        self.ticker_list = ticker_list
+        self.text_filter = text_filter
+        self.workers = {**DEFAULT_WORKERS, **(workers or {})}
+        self.delay = delay
+        self.persist_batch = persist_batch
+        self.persist_interval = persist_interval
+        self.on_persisted = on_persisted
+
+        # свои пулы закрываем при остановке, переданные извне — нет
+        self._own_executors = []
+        self.cpu_executor = cpu_executor or self._own(ThreadPoolExecutor(
+            max_workers=self.workers["detect"],
+            thread_name_prefix="ingest-cpu",
+        ))
+        self.io_executor = io_executor or self._own(ThreadPoolExecutor(
+            max_workers=self.workers["fetch"] + self.workers["enrich"]
+                        + self.workers["dedup"] + self.workers["persist"],
+            thread_name_prefix="ingest-io",
+        ))
+        # Эмбеддинги считаются моделью внутри checker — только в потоках, не в процессах
+        self.embed_executor = self._own(ThreadPoolExecutor(
+            max_workers=self.workers["dedup"],
+            thread_name_prefix="ingest-embed",
+        ))
+
+        # Очередь на вход каждой стадии, кроме fetch
+        self.queues = {stage: asyncio.Queue(maxsize=queue_size) for stage in STAGES[1:]}
+        QUEUE_DEPTH.set_function(lambda: {(stage,): depth for stage, depth in self.queue_depths().items()})
+
+    def _own(self, executor: Executor) -> Executor:
+        self._own_executors.append(executor)
+        return executor
+
+    async def _run_blocking(self, executor: Executor, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+    # --- стадии ------------------------------------------------------------
+
+    async def _fetch_source(self, name: str, collect, limit: asyncio.Semaphore):
+        async with limit:
+            try:
+                with FETCH_SECONDS.time(source=name):
+                    articles = await self._run_blocking(self.io_executor, collect)
+            except Exception as err:
+                log.error("Ошибка сбора из %s: %s", name, err)
+                return
+        log.info("%s: получено %d новостей", name, len(articles))
+        FETCHED.inc(len(articles), source=name)
+        for text in articles:
+            await self.queues["clean"].put({"source": name, "raw": text})
+
+    async def _fetch_loop(self):
+        limit = asyncio.Semaphore(self.workers["fetch"])
+        while True:
+            await asyncio.gather(*(
+                self._fetch_source(name, collect, limit)
+                for name, collect in self.sources.items()
+            ))
+            await asyncio.sleep(self.delay)
+
+    async def _clean(self, item: dict) -> dict | None:
+        text = _SPACES_RE.sub(" ", item["raw"]).strip()
+        if not text or text.startswith(_PARSER_ERRORS):
+            return None
+        if self.text_filter is not None:
+            item["prefilter_key"] = self.text_filter.check(text)
+            if item["prefilter_key"] is None:
+                log.debug("Дубликат (префильтр): %.60s", text)
+                return None
+        item["raw"] = text
+        return item
+
+    async def _detect(self, item: dict) -> dict:
+        item["tickers"] = await self._run_blocking(
+            self.cpu_executor, detect_tickers, item["raw"], self.ticker_lookup, self.ticker_list
+        )
+        return item
+
+    async def _enrich(self, item: dict) -> dict | None:
+        data = await self._run_blocking(
+            self.io_executor, enrich_news, item["raw"], item["tickers"], self.ticker_lookup, self.ticker_list
+        )
+        if data is None or not data["text"]:
+            log.warning("Нет ответа GPT для новости из %s", item["source"])
+            self._release(item)
+            return None
+        item.update(data)
+        return item
+
+    async def _dedup(self, item: dict) -> dict | None:
+        prepared = await self._run_blocking(self.embed_executor, self.checker.prepare, item["text"])
+        accepted = await self._run_blocking(
+            self.io_executor, self.checker.accept,
+            item["text"], item["tickers"], item["polarity"], item["intensity"], prepared,
+        )
+        # ключ префильтра зарезервирован в _clean: копии статьи отсекались,
+        # пока она шла через GPT; теперь её судьба решена — принята или дубликат
+        if self.text_filter is not None:
+            self.text_filter.remember(item["prefilter_key"])
+        if not accepted:
+            log.debug("Дубликат: %.60s", item["text"])
+            return None
+        return item
+
+    async def _persist(self) -> None:
+        # flush пишет все принятые новости разом, в том числе ещё стоящие в очереди
+        records = await self._run_blocking(self.io_executor, self.checker.flush)
+        if not records:
+            return
+        log.info("Записано новостей: %d", len(records))
+        if self.on_persisted is not None:
+            self.on_persisted(records)
+
+    # --- обвязка -----------------------------------------------------------
+
+    def _release(self, item: dict):
+        """Снимает резерв префильтра с брошенной статьи: следующая её копия пройдёт."""
+        if self.text_filter is not None and item.get("prefilter_key") is not None:
+            self.text_filter.release(item["prefilter_key"])
+
+    async def _worker(self, stage: str, handler, outbox: asyncio.Queue | None):
+        inbox = self.queues[stage]
+        while True:
+            item = await inbox.get()
+            try:
+                with STAGE_SECONDS.time(stage=stage):
+                    result = await handler(item)
+                STAGE_ITEMS.inc(stage=stage, result="dropped" if result is None else "passed")
+                if result is not None and outbox is not None:
+                    await outbox.put(result)
+            except Exception:
+                STAGE_ITEMS.inc(stage=stage, result="error")
+                log.exception("Ошибка на стадии %s", stage)
+                self._release(item)
+            finally:
+                inbox.task_done()
+
+    async def _persist_worker(self):
+        """
+        Копит новости до persist_batch штук или persist_interval секунд
+        и записывает их одной транзакцией. До записи принятые новости уже
+        учитываются при проверке дубликатов (см. DBNewsDeduplicator.accept).
+        """
+        inbox = self.queues["persist"]
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await inbox.get()]
+            deadline = loop.time() + self.persist_interval
+            while len(batch) < self.persist_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(inbox.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                with STAGE_SECONDS.time(stage="persist"):
+                    await self._persist()
+                STAGE_ITEMS.inc(len(batch), stage="persist", result="passed")
+            except Exception:
+                STAGE_ITEMS.inc(len(batch), stage="persist", result="error")
+                log.exception("Ошибка на стадии persist")
+            finally:
+                for _ in batch:
+                    inbox.task_done()
+
+    async def run(self):
+        """Запускает все стадии и работает до отмены задачи."""
+        handlers = {
+            "clean": (self._clean, self.queues["detect"]),
+            "detect": (self._detect, self.queues["enrich"]),
+            "enrich": (self._enrich, self.queues["dedup"]),
+            "dedup": (self._dedup, self.queues["persist"]),
+        }
+        tasks = [asyncio.create_task(self._fetch_loop(), name="ingest-fetch")]
+        for stage, (handler, outbox) in handlers.items():
+            for i in range(self.workers[stage]):
+                tasks.append(asyncio.create_task(
+                    self._worker(stage, handler, outbox), name=f"ingest-{stage}-{i}"
+                ))
+        for i in range(self.workers["persist"]):
+            tasks.append(asyncio.create_task(self._persist_worker(), name=f"ingest-persist-{i}"))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            for executor in self._own_executors:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def queue_depths(self) -> dict[str, int]:
+        return {stage: queue.qsize() for stage, queue in self.queues.items()}
@@ -1,55 +1,91 @@
 from aiogram import Bot
-from db.connector import get_db_connection
+from db import pool
+from db.partitions import HOT_WINDOW
+from services.send_engine import Priority, send_engine
+from services.user_cache import user_cache
+from utils import metrics
+from utils.message_composer import compose
+
+DIGEST_SIZE = 20  # новостей в дайджесте
+
+DIGEST_GROUPS = metrics.gauge("digest_groups", "Различных фильтров в последнем дайджесте")
+
+
+def group_by_filter(users: list[dict]) -> dict[tuple[str, ...], list[int]]:
+    """Пользователи с одинаковым набором тикеров получают один и тот же дайджест."""
+    groups: dict[tuple[str, ...], list[int]] = {}
+    for user in users:
+        key = tuple(sorted(set(user["filter"])))
+        groups.setdefault(key, []).append(user["telegram_id"])
+    return groups
+
+
+async def fetch_candidates(tickers: list[str], with_unfiltered: bool) -> list[dict]:
+    """
+    Одним запросом: последние DIGEST_SIZE новостей каждого тикера из фильтров
+    и, если есть пользователи без фильтра, последние DIGEST_SIZE вообще.
+    Верхние DIGEST_SIZE любой группы тикеров всегда среди этих строк.
+    """
+    rows = await pool.fetch(
+        "digest_candidates",
+        """
+        WITH per_ticker AS (
+            SELECT n.id, row_number() OVER (PARTITION BY w.t ORDER BY n.id DESC) AS rn
+            FROM news n
+            JOIN unnest($1::text[]) AS w(t) ON w.t = ANY(n.ticker)
+            WHERE n.published_time > now() - $3::interval
+        )
+        SELECT id, text, ticker
+        FROM news
+        WHERE published_time > now() - $3::interval
+          AND (id IN (SELECT id FROM per_ticker WHERE rn <= $2)
+               OR ($4 AND id IN (SELECT id FROM news
+                                 WHERE published_time > now() - $3::interval
+                                 ORDER BY id DESC
+                                 LIMIT $2)))
+        ORDER BY id DESC
+        """,
+        tickers, DIGEST_SIZE, HOT_WINDOW, with_unfiltered
+    )
+    return [{"id": row["id"], "text": row["text"], "tickers": set(row["ticker"])} for row in rows]
+
+
+def render_digest(candidates: list[dict], tickers: tuple[str, ...]) -> list[str]:
+    """Сообщения дайджеста для набора тикеров (пустой набор — все новости); пусто, если новостей нет."""
+    wanted = set(tickers)
+    items = [c for c in candidates if not wanted or c["tickers"] & wanted][:DIGEST_SIZE]
+    if not items:
+        return []
+    # в хронологическом порядке
+    return compose(
+        [item["text"] for item in reversed(items)],
+        prefix="📰 ",
+        header="🌅 <b>Утренний дайджест</b>",
+        separator="\n"
+    )
+
 
 async def send_morning_digest(bot: Bot):
-    """Собирает последние новости и отправляет одним сообщением"""
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT telegram_id, filter FROM users")
-            users = cur.fetchall()
-
-            for tg_id, tickers in users:
-                # Если у пользователя указаны тикеры — фильтруем по ним, иначе берём все
-                if tickers:
-                    query = (
-                        """
-                        SELECT text
-                        FROM news
-                        WHERE ticker && %s
-                        ORDER BY id DESC
-                        LIMIT 20
-                        """
-                    )
-                    params = (tickers,)
-                else:
-                    query = (
-                        """
-                        SELECT text
-                        FROM news
-                        ORDER BY id DESC
-                        LIMIT 20
-                        """
-                    )
-                    params = None
-
-                # Выполняем запрос
-                if params:
-                    cur.execute(query, params)
-                else:
-                    cur.execute(query)
-
-                rows = cur.fetchall()
-                if not rows:
-                    continue
-
-                # Формируем и отправляем дайджест в хронологическом порядке
-                digest_lines = [f"📰 {text}" for (text,) in rows]
-                digest = "\n".join(reversed(digest_lines))
-                await bot.send_message(
-                    chat_id=tg_id,
-                    text=f"🌅 *Утренний дайджест*\n\n{digest}",
-                    parse_mode="Markdown"
+    """
+    Собирает последние новости и отправляет минимумом сообщений.
+    Дайджест строится один раз на каждый различный фильтр, а не на пользователя.
+    """
+    groups = group_by_filter(user_cache.all())
+    if not groups:
+        return
+    DIGEST_GROUPS.set(len(groups))
+
+    tickers = sorted({t for key in groups for t in key})
+    candidates = await fetch_candidates(tickers, with_unfiltered=() in groups)
+
+    for key, tg_ids in groups.items():
+        messages = render_digest(candidates, key)
+        for tg_id in tg_ids:
+            for text in messages:
+                send_engine.submit(
+                    tg_id,
+                    text,
+                    priority=Priority.DIGEST,
+                    kind="digest",
+                    parse_mode="HTML"
                 )
-    finally:
-        conn.close()
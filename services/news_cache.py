@@ -0,0 +1,163 @@
+import asyncio
+import heapq
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable
+
+from db import pool
+from db.partitions import HOT_WINDOW
+from utils import metrics
+
+log = logging.getLogger(__name__)
+
+CAPACITY = 50  # последних новостей на тикер
+
+NEWS_CACHED = metrics.gauge("news_cache_items", "Новостей в кольцевых буферах (с повторами по тикерам)")
+NEWS_CACHE_READS = metrics.counter("news_cache_reads_total", "Чтения ленты новостей", ("result",))
+
+_NEWS_COLUMNS = "id, text, ticker, polarity, intensity, published_time"
+
+
+class NewsCache:
+    """
+    Последние новости в памяти: кольцевой буфер на каждый тикер и общий
+    буфер для пользователей без фильтра. Лента /news собирается слиянием
+    буферов тикеров фильтра по убыванию id, без запроса к БД.
+
+    Наполняется записанными новостями: в одном процессе с конвейером —
+    через add(records) из on_persisted, в отдельном процессе бота —
+    по NOTIFY в NEWS_CHANNEL (catch_up дочитывает новости с id > last_id).
+    Запись — словарь id, text, tickers, polarity, intensity, published_time.
+    listeners вызываются с каждой пачкой действительно новых записей
+    (после warm(), чтобы старые новости не считались новыми).
+    """
+
+    def __init__(self, capacity: int = CAPACITY):
+        self.capacity = capacity
+        self._by_ticker: dict[str, deque] = {}
+        self._all: deque = deque(maxlen=capacity)
+        self.last_id = 0
+        self.ready = False   # до warm() лента читается из БД
+        self._catch_up_task: asyncio.Task | None = None
+        self._dirty = False
+        self.listeners: list[Callable[[list[dict]], None]] = []
+        NEWS_CACHED.set_function(lambda: len(self._all) + sum(len(d) for d in self._by_ticker.values()))
+
+    def add(self, records: list[dict]):
+        """Добавляет новости в порядке id; уже известные (id <= last_id) пропускаются."""
+        added = []
+        for record in sorted(records, key=lambda r: r["id"]):
+            if record["id"] <= self.last_id:
+                continue
+            added.append(record)
+            self._all.append(record)
+            for ticker in record["tickers"]:
+                buf = self._by_ticker.get(ticker)
+                if buf is None:
+                    buf = self._by_ticker[ticker] = deque(maxlen=self.capacity)
+                buf.append(record)
+            self.last_id = record["id"]
+        if added and self.ready:
+            for listener in self.listeners:
+                try:
+                    listener(added)
+                except Exception:
+                    log.exception("Кеш новостей: ошибка подписчика %r", listener)
+
+    def latest(self, tickers: list[str], limit: int) -> list[dict]:
+        """limit свежих новостей хотя бы по одному из тикеров (все новости, если тикеров нет)."""
+        NEWS_CACHE_READS.inc(result="hit")
+        if tickers:
+            buffers = [reversed(self._by_ticker[t]) for t in set(tickers) if t in self._by_ticker]
+        else:
+            buffers = [reversed(self._all)]
+        cutoff = datetime.now(timezone.utc) - HOT_WINDOW
+        result, seen = [], set()
+        # буферы упорядочены по id, так что слияние идёт от свежих к старым.
+        # id не упорядочен по published_time (архивные новости из backfill),
+        # поэтому старая новость пропускается, а не обрывает ленту
+        for record in heapq.merge(*buffers, key=lambda r: r["id"], reverse=True):
+            if len(result) >= limit:
+                break
+            if record["published_time"] <= cutoff:
+                continue
+            if record["id"] not in seen:
+                seen.add(record["id"])
+                result.append(record)
+        return result
+
+    # --- загрузка из БД ----------------------------------------------------
+
+    async def warm(self):
+        """Холодный старт: последние capacity новостей каждого тикера и общие за HOT_WINDOW."""
+        rows = await pool.fetch(
+            "news_cache_warm",
+            f"""
+            SELECT {_NEWS_COLUMNS}
+            FROM news
+            WHERE id IN (
+                SELECT id FROM (
+                    SELECT n.id, row_number() OVER (PARTITION BY t ORDER BY n.id DESC) AS rn
+                    FROM news n, unnest(n.ticker) AS t
+                    WHERE n.published_time > now() - $1::interval
+                ) per_ticker
+                WHERE rn <= $2
+                UNION
+                (SELECT id FROM news
+                 WHERE published_time > now() - $1::interval
+                 ORDER BY id DESC
+                 LIMIT $2)
+            )
+              AND published_time > now() - $1::interval
+            """,
+            HOT_WINDOW, self.capacity
+        )
+        self.add([_record(row) for row in rows])
+        self.ready = True
+        log.info("Кеш новостей: загружено %d, тикеров %d", len(rows), len(self._by_ticker))
+
+    async def catch_up(self):
+        rows = await pool.fetch(
+            "news_cache_catch_up",
+            f"""
+            SELECT {_NEWS_COLUMNS}
+            FROM news
+            WHERE id > $1
+              AND published_time > now() - $2::interval
+            ORDER BY id
+            """,
+            self.last_id, HOT_WINDOW
+        )
+        self.add([_record(row) for row in rows])
+
+    def on_notify(self, channel: str, payload: str):
+        """Обработчик NEWS_CHANNEL: пачка NOTIFY одной записи схлопывается в один запрос."""
+        self._dirty = True
+        if self._catch_up_task is None or self._catch_up_task.done():
+            self._catch_up_task = asyncio.get_running_loop().create_task(self._catch_up_loop())
+
+    async def _catch_up_loop(self):
+        while self._dirty:
+            # даём транзакции записи дослать остальные уведомления пачки
+            await asyncio.sleep(0.05)
+            self._dirty = False
+            try:
+                await self.catch_up()
+            except Exception:
+                log.exception("Кеш новостей: ошибка дочитывания")
+
+
+def _record(row) -> dict:
+    return {
+        "id": row["id"],
+        "text": row["text"],
+        "tickers": list(row["ticker"]),
+        "polarity": row["polarity"],
+        "intensity": row["intensity"],
+        "published_time": row["published_time"],
+    }
+
+
+# Общий кеш процесса бота
+news_cache = NewsCache()
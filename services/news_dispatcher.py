@@ -1,60 +1,201 @@
 import asyncio
+import logging
+
+import numpy as np
+
 from aiogram import Bot
-from aiogram.exceptions import TelegramBadRequest
-from db.connector import get_db_connection
+from db import pool
+from db.partitions import HOT_WINDOW
+from services.delivery_scheduler import DeliveryScheduler
+from services.ranking import rank
+from services.send_engine import Priority, send_engine
+from services.topics import topic_index
+from services.urgent_alerts import urgent_alerts
+from services.user_cache import user_cache
+from utils import metrics
+from utils.message_composer import compose
 
-async def process_user_news(bot: Bot, tg_id, tickers, limit):
-    """Отправляет свежие новости одному пользователю"""
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cur:
-            if tickers:
-                # выборка по указанным тикерам
-                cur.execute(
-                    """
-                    SELECT id, text
-                    FROM news
-                    WHERE ticker && %s
-                    ORDER BY id DESC
-                    LIMIT %s
-                    """,
-                    (tickers, limit)
-                )
-            else:
-                # если тикеры не заданы — берём все
-                cur.execute(
-                    """
-                    SELECT id, text
-                    FROM news
-                    ORDER BY id DESC
-                    LIMIT %s
-                    """,
-                    (limit,)
-                )
-
-            for news_id, text in cur.fetchall():
-                try:
-                    await bot.send_message(
-                        chat_id=tg_id,
-                        text=f"📢 {text}"
-                    )
-                except TelegramBadRequest:
-                    continue
-    finally:
-        conn.close()
-
-
-async def news_dispatcher_task(bot: Bot):
-    """Основной цикл рассылки новостей"""
+log = logging.getLogger(__name__)
+
+TICK_NEWS = metrics.histogram("dispatch_tick_news", "Новых новостей за такт рассылки",
+                              buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500))
+TICK_RECIPIENTS = metrics.histogram("dispatch_tick_recipients", "Получателей за такт рассылки",
+                                    buckets=(0, 1, 10, 100, 1000, 10000, 100000))
+PENDING_USERS = metrics.gauge("dispatch_pending_users", "Пользователей с неотправленной пачкой новостей")
+
+MAX_CANDIDATES = 100  # сколько свежих новостей копить в пачке до ранжирования
+
+
+async def fetch_new_news(after_id: int) -> list[dict]:
+    """Новости с id > after_id — один запрос на такт для всех пользователей."""
+    rows = await pool.fetch(
+        "news_after_id",
+        """
+        SELECT id, text, ticker, polarity, intensity, sources, published_time, embedding
+        FROM news
+        WHERE id > $1
+          AND published_time > now() - $2::interval
+        ORDER BY id
+        """,
+        after_id, HOT_WINDOW
+    )
+    return [
+        {
+            "id": row["id"],
+            "text": row["text"],
+            "tickers": row["ticker"],
+            "polarity": row["polarity"],
+            "intensity": row["intensity"],
+            "sources": row["sources"],
+            "published_time": row["published_time"],
+            "embedding": row["embedding"],
+        }
+        for row in rows
+    ]
+
+
+async def refresh_sources(batches: list[tuple[int, list[dict]]]):
+    """Дубликаты из других источников приходят и после записи новости — перечитываем news.sources."""
+    items = {item["id"]: item for _, batch in batches for item in batch}
+    if not items:
+        return
+    rows = await pool.fetch(
+        "news_sources",
+        """
+        SELECT id, sources
+        FROM news
+        WHERE id = ANY($1::int[])
+          AND published_time > now() - $2::interval
+        """,
+        list(items), HOT_WINDOW
+    )
+    for row in rows:
+        items[row["id"]]["sources"] = row["sources"]
+
+
+def plan_deliveries(news: list[dict], default_cursor: int) -> dict[int, list[dict]]:
+    """
+    Раскладывает новые новости по получателям через индекс тикер → подписчики
+    и смысловые темы (topic_index: одно матричное произведение на такт).
+    Пользователю достаются новости новее его курсора.
+    Пользователи без курсора (новые) начинают с default_cursor.
+    """
+    by_topic = topic_index.match(np.stack([item["embedding"] for item in news])) if news else []
+    planned: dict[int, list[dict]] = {}
+    for item, topic_subscribers in zip(news, by_topic):
+        # эмбеддинг больше не нужен, а пачки в DeliveryScheduler живут до отправки
+        item.pop("embedding", None)
+        for tg_id in user_cache.subscribers(item["tickers"]) | topic_subscribers:
+            profile = user_cache.get(tg_id)
+            if profile is None:
+                continue
+            cursor = profile["last_news_id"] if profile["last_news_id"] is not None else default_cursor
+            if item["id"] > cursor:
+                planned.setdefault(tg_id, []).append(item)
+    return planned
+
+
+def process_user_news(tg_id: int, items: list[dict]):
+    """
+    Ставит новости пользователя в очередь отправки в порядке публикации,
+    упакованные в как можно меньше сообщений. Новости, уже ушедшие срочным
+    оповещением, пропускаются.
+    Курсор двигается при постановке: повторов не будет, даже если чат недоступен.
+    """
+    texts = [item["text"] for item in items if not urgent_alerts.was_alerted(tg_id, item["id"])]
+    for text in compose(texts, prefix="📢 "):
+        send_engine.submit(tg_id, text, priority=Priority.NEWS, kind="news", parse_mode="HTML")
+
+
+async def save_cursors(cursors: dict[int, int]):
+    """Сохраняет курсоры доставки одним UPDATE; курсор только растёт."""
+    if not cursors:
+        return
+    await pool.execute(
+        "users_cursor_update",
+        """
+        UPDATE users AS u
+        SET last_news_id = c.news_id
+        FROM unnest($1::bigint[], $2::int[]) AS c(telegram_id, news_id)
+        WHERE u.telegram_id = c.telegram_id
+          AND (u.last_news_id IS NULL OR u.last_news_id < c.news_id)
+        """,
+        list(cursors), list(cursors.values())
+    )
+    for tg_id, news_id in cursors.items():
+        user_cache.advance_cursor(tg_id, news_id)
+
+
+async def _start_cursor() -> int:
+    """
+    С какой новости начинать после запуска: с самого отстающего курсора,
+    чтобы дослать пропущенное за время простоя (в пределах HOT_WINDOW).
+    """
+    cursors = [u["last_news_id"] for u in user_cache.all() if u["last_news_id"] is not None]
+    if cursors:
+        return min(cursors)
+    return await pool.fetchval("news_max_id", "SELECT COALESCE(max(id), 0) FROM news")
+
+
+DELAY = 60  # секунда; страховочный опрос, если уведомления не приходят
+
+
+async def news_dispatcher_task(bot: Bot, wake: asyncio.Event | None = None):
+    """
+    Основной цикл рассылки новостей; сообщения уходят через send_engine.
+    wake — событие «появились новые новости» (LISTEN/NOTIFY или конвейер
+    в том же процессе); без него цикл просто опрашивает БД раз в DELAY секунд.
+
+    За такт новые новости читаются один раз и раздаются только подписчикам
+    их тикеров в пачки DeliveryScheduler; пачка уходит, когда у пользователя
+    истёк news_interval. Из пачки уходят noise_tolerance лучших по
+    services.ranking, остальные пропускаются.
+    users.last_news_id помнит, что пользователь уже получил (или пропустил).
+    """
+    scheduler = DeliveryScheduler()
+    PENDING_USERS.set_function(lambda: len(scheduler))
+    last_id = await _start_cursor()
+    cursors: dict[int, int] = {}  # пользователь → курсор, ещё не записанный в БД
     while True:
-        conn = get_db_connection()
+        unsent: dict[int, list[dict]] = {}
         try:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "SELECT telegram_id, filter, noise_tolerance FROM users"
-                )
-                for tg_id, tickers, limit in cur.fetchall():
-                    await process_user_news(bot, tg_id, tickers, limit)
-        finally:
-            conn.close()
-        await asyncio.sleep(60)
+            news = await fetch_new_news(last_id)
+            TICK_NEWS.observe(len(news))
+            if news:
+                for tg_id, items in plan_deliveries(news, default_cursor=last_id).items():
+                    scheduler.add(tg_id, items, limit=MAX_CANDIDATES)
+                last_id = news[-1]["id"]
+
+            due = scheduler.pop_due()
+            TICK_RECIPIENTS.observe(len(due))
+            unsent = dict(due)
+            await refresh_sources(due)
+            for tg_id, items in rank(due):
+                # курсор сдвигается за всю пачку, в том числе за не вошедшее в top-k
+                cursors[tg_id] = unsent.pop(tg_id)[-1]["id"]
+                process_user_news(tg_id, items)
+                profile = user_cache.get(tg_id)
+                scheduler.mark_sent(tg_id, profile["news_interval"] if profile else None)
+            await save_cursors(cursors)
+            cursors = {}
+        except Exception:
+            # такт не должен останавливать рассылку: неразосланные пачки
+            # возвращаются в планировщик, курсоры запишутся следующим тактом
+            log.exception("Ошибка такта рассылки новостей")
+            for tg_id, items in unsent.items():
+                scheduler.add(tg_id, items, limit=MAX_CANDIDATES)
+
+        await _wait_for_news(wake, scheduler.next_due_in())
+
+
+async def _wait_for_news(wake: asyncio.Event | None, due_in: float | None = None):
+    # просыпаемся по новой новости, к ближайшей доставке или по страховочному DELAY
+    timeout = DELAY if due_in is None else min(DELAY, due_in)
+    if wake is None:
+        await asyncio.sleep(timeout)
+        return
+    try:
+        await asyncio.wait_for(wake.wait(), timeout=timeout)
+    except asyncio.TimeoutError:
+        pass
+    wake.clear()
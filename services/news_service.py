@@ -1,18 +1,23 @@
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, List
 
 from sqlalchemy.dialects.postgresql import insert
 
 from db.connector import engine, news
 
 
-def save_news(data: Dict[str, Any]) -> int:
-    required_fields = ["text", "published_time", "ticker", "polarity", "intensity", "minhash", "embedding"]
+REQUIRED_FIELDS = ["text", "published_time", "ticker", "polarity", "intensity", "minhash", "embedding"]
+
 
-    missing_fields = [field for field in required_fields if field not in data]
+def _check_fields(data: Dict[str, Any]):
+    missing_fields = [field for field in REQUIRED_FIELDS if field not in data]
     if missing_fields:
         raise ValueError(f"Обязательные поля отсутствуют: {', '.join(missing_fields)}")
 
+
+def save_news(data: Dict[str, Any]) -> int:
+    _check_fields(data)
+
     stmt = (
         insert(news)
         .values(**data)
@@ -21,4 +26,21 @@ def save_news(data: Dict[str, Any]) -> int:
 
     with engine.begin() as conn:
         result = conn.execute(stmt)
-        return result.scalar_one()
\ No newline at end of file
+        return result.scalar_one()
+
+
+def save_news_many(rows: List[Dict[str, Any]]) -> List[int]:
+    """
+    Записывает пачку новостей одной транзакцией и одним многострочным INSERT.
+    Возвращает id в том же порядке, что и rows.
+    """
+    if not rows:
+        return []
+    for data in rows:
+        _check_fields(data)
+
+    stmt = insert(news).returning(news.c.id, sort_by_parameter_order=True)
+
+    with engine.begin() as conn:
+        result = conn.execute(stmt, rows)
+        return list(result.scalars())
@@ -0,0 +1,92 @@
+from datetime import datetime, timezone
+
+import numpy as np
+
+from services.user_cache import user_cache
+from utils import metrics
+
+RANK_SECONDS = metrics.histogram("ranking_seconds", "Ранжирование пачек новостей за такт")
+
+DEFAULT_TOP_K = 10  # noise_tolerance по умолчанию
+
+# Признаки новости (столбцы матрицы F):
+#   extremeness — насколько intensity далека от нейтральной середины, 0..1
+#   polarity    — +1 позитив, −1 негатив, 0 нейтрально; знак предпочтения задаёт users.style
+#   sources     — сколько источников принесли новость (news.sources), log-шкала 0..1
+#   match       — доля тикеров новости, входящих в фильтр пользователя (матрица U×N)
+#   recency     — exp(−возраст / τ), τ зависит от горизонта трейдера (матрица U×N)
+_POLARITY = {"positive": 1.0, "negative": -1.0}
+
+# Веса признаков по trader_type: extremeness, sources, match, recency.
+# Краткосрочному важны свежесть и сила события, долгосрочному — подтверждённость источниками.
+_WEIGHTS = {
+    "short":  (1.0, 0.3, 0.6, 1.5),
+    "medium": (0.8, 0.6, 0.8, 1.0),
+    "long":   (0.5, 1.0, 1.0, 0.5),
+}
+_DEFAULT_WEIGHTS = _WEIGHTS["medium"]
+# τ свежести, секунды
+_RECENCY_TAU = {"short": 1800.0, "medium": 7200.0, "long": 43200.0}
+_DEFAULT_TAU = _RECENCY_TAU["medium"]
+POLARITY_WEIGHT = 0.5  # вес совпадения знака новости с users.style
+
+
+def rank(batches: list[tuple[int, list[dict]]], now: datetime | None = None) -> list[tuple[int, list[dict]]]:
+    """
+    Выбирает для каждого пользователя top-k (k = noise_tolerance) новостей
+    из его пачки кандидатов. Все пачки такта оцениваются одним матричным
+    выражением U×N (пользователи × различные новости); кандидаты не из
+    пачки пользователя маскируются −inf.
+
+    Новость — словарь id, text, tickers, polarity, intensity, sources,
+    published_time. Выбранные новости возвращаются в порядке id.
+    """
+    if not batches:
+        return []
+    with RANK_SECONDS.time():
+        now = now or datetime.now(timezone.utc)
+        items = list({item["id"]: item for _, batch in batches for item in batch}.values())
+        column = {item["id"]: j for j, item in enumerate(items)}
+        profiles = [user_cache.get(tg_id) or {} for tg_id, _ in batches]
+
+        # признаки новостей, N
+        intensity = np.array([item["intensity"] for item in items], dtype=np.float32)
+        extremeness = np.clip(np.abs(intensity - 5.5) / 4.5, 0, 1)
+        polarity = np.array([_POLARITY.get(item["polarity"], 0.0) for item in items], dtype=np.float32)
+        sources = np.array([item.get("sources") or 1 for item in items], dtype=np.float32)
+        sources = np.clip(np.log2(sources) / 3, 0, 1)   # 1 источник → 0, 8 и больше → 1
+        age = np.array([(now - item["published_time"]).total_seconds() for item in items], dtype=np.float32)
+        age = np.maximum(age, 0)
+
+        # параметры пользователей, U
+        weights = np.array([_WEIGHTS.get(p.get("trader_type"), _DEFAULT_WEIGHTS) for p in profiles],
+                           dtype=np.float32)
+        tau = np.array([_RECENCY_TAU.get(p.get("trader_type"), _DEFAULT_TAU) for p in profiles], dtype=np.float32)
+        style = np.array([float(p.get("style") or 0) for p in profiles], dtype=np.float32)
+
+        # совпадение тикеров и маска кандидатов, U×N
+        match = np.zeros((len(batches), len(items)), dtype=np.float32)
+        mask = np.zeros((len(batches), len(items)), dtype=bool)
+        for i, ((_, batch), profile) in enumerate(zip(batches, profiles)):
+            wanted = set(profile.get("filter") or ())
+            for item in batch:
+                j = column[item["id"]]
+                mask[i, j] = True
+                if wanted and item["tickers"]:
+                    match[i, j] = len(wanted.intersection(item["tickers"])) / len(item["tickers"])
+
+        recency = np.exp(-age[None, :] / tau[:, None])
+        scores = (weights[:, 0:1] * extremeness[None, :]
+                  + weights[:, 1:2] * sources[None, :]
+                  + weights[:, 2:3] * match
+                  + weights[:, 3:4] * recency
+                  + POLARITY_WEIGHT * np.sign(style)[:, None] * polarity[None, :])
+        scores = np.where(mask, scores, -np.inf)
+        order = np.argsort(-scores, axis=1, kind="stable")
+
+        result = []
+        for i, (tg_id, batch) in enumerate(batches):
+            k = min(profiles[i].get("noise_tolerance") or DEFAULT_TOP_K, len(batch))
+            chosen = [items[j] for j in order[i, :k]]
+            result.append((tg_id, sorted(chosen, key=lambda item: item["id"])))
+        return result
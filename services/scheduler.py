@@ -6,6 +6,10 @@ from .morning_digest import send_morning_digest
 
 moscow_tz = pytz.timezone('Europe/Moscow')
 
+# Основная сессия: с этими часами сверяются и срочные оповещения (services/urgent_alerts.py)
+TRADING_OPEN_HOUR = 10
+TRADING_CLOSE_HOUR = 19
+
 
 def setup_scheduler(bot: Bot):
     scheduler = AsyncIOScheduler(timezone=moscow_tz)
@@ -20,14 +24,14 @@ def setup_scheduler(bot: Bot):
     # Начало торгов в 10:00
     scheduler.add_job(
         send_trading_start,
-        'cron', hour=10, minute=0,
+        'cron', hour=TRADING_OPEN_HOUR, minute=0,
         kwargs={'bot': bot}
     )
 
     # Окончание торгов в 19:00
     scheduler.add_job(
         send_trading_end,
-        'cron', hour=19, minute=0,
+        'cron', hour=TRADING_CLOSE_HOUR, minute=0,
         kwargs={
             'bot': bot,
             'additional_message': "📊 Торги завершены. Новости после закрытия будут включены в завтрашнюю утреннюю газету."
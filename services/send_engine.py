@@ -0,0 +1,208 @@
+import asyncio
+import itertools
+import logging
+import time
+from enum import IntEnum
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from utils import metrics
+
+log = logging.getLogger(__name__)
+
+GLOBAL_RATE = 30.0      # сообщений в секунду на бота (лимит Telegram для рассылок)
+GLOBAL_BURST = 30       # сколько можно отправить разом после простоя
+PER_CHAT_INTERVAL = 1.0  # не чаще одного сообщения в секунду в один чат
+WORKERS = 10            # одновременных запросов к Bot API
+MAX_ATTEMPTS = 3        # попыток при сетевых ошибках и 5xx (RetryAfter не считается)
+
+SEND_SECONDS = metrics.histogram("telegram_send_seconds", "Вызов send_message", ("kind",))
+SENT = metrics.counter("telegram_messages_total", "Сообщения в Telegram по исходу", ("kind", "result"))
+SEND_LATENCY = metrics.histogram("send_engine_latency_seconds", "От постановки в очередь до отправки", ("lane",))
+SEND_QUEUE = metrics.gauge("send_engine_queue_depth", "Сообщений в очереди отправки", ("lane",))
+RETRY_AFTER = metrics.counter("send_engine_retry_after_total", "Ответы 429 Too Many Requests")
+
+
+class Priority(IntEnum):
+    """Полосы очереди: меньшее значение уходит раньше."""
+    ALERT = 0
+    NEWS = 1
+    DIGEST = 2
+    BROADCAST = 3
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        # под замком ждущие получают токены строго по очереди
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Останавливает выдачу токенов на seconds: после паузы bucket наполняется с нуля."""
+        now = time.monotonic()
+        self.tokens = 0.0
+        # отсчёт пополнения начинается в будущем: до него tokens < 0 и acquire ждёт
+        self.updated = max(self.updated, now + seconds)
+
+
+class SendEngine:
+    """
+    Общая очередь отправки сообщений бота.
+
+    Сервисы ставят сообщения через submit(); воркеры отправляют их по
+    приоритету полос, соблюдая общий token bucket (~30 сообщений/с) и
+    интервал между сообщениями одного чата. TelegramRetryAfter не теряет
+    сообщение: оно возвращается в очередь через retry_after секунд.
+
+    Результат submit() — future: True, если сообщение доставлено.
+    """
+
+    def __init__(self, rate: float = GLOBAL_RATE, burst: int = GLOBAL_BURST,
+                 per_chat_interval: float = PER_CHAT_INTERVAL, workers: int = WORKERS):
+        self.bucket = TokenBucket(rate, burst)
+        self.per_chat_interval = per_chat_interval
+        self.workers = workers
+        self.bot: Bot | None = None
+        self._queue: asyncio.PriorityQueue | None = None
+        self._seq = itertools.count()
+        self._chat_free_at: dict[int, float] = {}   # чат → когда в него можно писать снова
+        self._depth = {lane: 0 for lane in Priority}  # в очереди и отложенные, по полосам
+        self._tasks: list[asyncio.Task] = []
+        SEND_QUEUE.set_function(lambda: {(lane.name.lower(),): n for lane, n in self._depth.items()})
+
+    async def start(self, bot: Bot):
+        self.bot = bot
+        self._queue = asyncio.PriorityQueue()
+        self._tasks = [asyncio.create_task(self._worker(), name=f"send-{i}") for i in range(self.workers)]
+        log.info("Очередь отправки запущена: %d воркеров", self.workers)
+
+    async def stop(self, drain: float = 10.0):
+        """Даёт очереди до drain секунд на отправку, затем останавливает воркеры."""
+        if self._queue is not None and drain:
+            try:
+                await asyncio.wait_for(self._drained(), timeout=drain)
+            except asyncio.TimeoutError:
+                log.warning("Очередь отправки остановлена, не отправлено: %d", self.pending())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _drained(self):
+        while self.pending():
+            await asyncio.sleep(0.1)
+
+    def pending(self) -> int:
+        return sum(self._depth.values())
+
+    def queue_depths(self) -> dict[str, int]:
+        return {lane.name.lower(): n for lane, n in self._depth.items()}
+
+    def submit(self, chat_id: int, text: str, priority: Priority = Priority.NEWS,
+               kind: str = "news", **kwargs) -> asyncio.Future:
+        """Ставит сообщение в очередь; kwargs передаются в bot.send_message."""
+        if self._queue is None:
+            raise RuntimeError("Очередь отправки не запущена: вызовите send_engine.start(bot)")
+        job = {
+            "chat_id": chat_id,
+            "text": text,
+            "kwargs": kwargs,
+            "kind": kind,
+            "priority": Priority(priority),
+            "enqueued": time.monotonic(),
+            "attempts": 0,
+            "future": asyncio.get_running_loop().create_future(),
+        }
+        self._depth[job["priority"]] += 1
+        self._put(job)
+        return job["future"]
+
+    def _put(self, job: dict):
+        self._queue.put_nowait((job["priority"], next(self._seq), job))
+
+    def _defer(self, job: dict, delay: float):
+        # чат занят или Telegram попросил подождать — вернуть в очередь позже
+        asyncio.get_running_loop().call_later(delay, self._put, job)
+
+    def _done(self, job: dict, result: bool, outcome: str):
+        self._depth[job["priority"]] -= 1
+        SENT.inc(kind=job["kind"], result=outcome)
+        if not job["future"].done():
+            job["future"].set_result(result)
+
+    async def _worker(self):
+        while True:
+            _, _, job = await self._queue.get()
+            try:
+                await self._send(job)
+            except Exception:
+                log.exception("Очередь отправки: ошибка для чата %s", job["chat_id"])
+                self._done(job, False, "error")
+            finally:
+                self._queue.task_done()
+
+    async def _send(self, job: dict):
+        chat_id = job["chat_id"]
+        now = time.monotonic()
+        free_at = self._chat_free_at.get(chat_id, 0.0)
+        if free_at > now:
+            self._defer(job, free_at - now)
+            return
+        self._chat_free_at[chat_id] = now + self.per_chat_interval
+        if len(self._chat_free_at) > 100_000:
+            self._chat_free_at = {c: t for c, t in self._chat_free_at.items() if t > now}
+
+        await self.bucket.acquire()
+        job["attempts"] += 1
+        try:
+            with SEND_SECONDS.time(kind=job["kind"]):
+                await self.bot.send_message(chat_id=chat_id, text=job["text"], **job["kwargs"])
+        except TelegramRetryAfter as err:
+            RETRY_AFTER.inc()
+            job["attempts"] -= 1
+            # 429 — общий лимит бота, а не одного чата: ждут все воркеры и полосы
+            self.bucket.pause(err.retry_after)
+            self._chat_free_at[chat_id] = time.monotonic() + err.retry_after
+            self._defer(job, err.retry_after)
+            return
+        except TelegramForbiddenError:
+            self._done(job, False, "forbidden")   # пользователь заблокировал бота
+            return
+        except TelegramBadRequest as err:
+            log.warning("Отправка в %s отклонена: %s", chat_id, err)
+            self._done(job, False, "bad_request")
+            return
+        except (TelegramNetworkError, TelegramServerError) as err:
+            if job["attempts"] < MAX_ATTEMPTS:
+                self._defer(job, 2 ** job["attempts"])
+            else:
+                log.warning("Отправка в %s не удалась: %s", chat_id, err)
+                self._done(job, False, "error")
+            return
+        SEND_LATENCY.observe(time.monotonic() - job["enqueued"], lane=job["priority"].name.lower())
+        self._done(job, True, "ok")
+
+
+# Общая очередь процесса бота
+send_engine = SendEngine()
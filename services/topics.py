@@ -0,0 +1,230 @@
+import asyncio
+import logging
+
+import numpy as np
+from pgvector import Vector
+from pgvector.psycopg2 import register_vector
+from psycopg2.extras import execute_values
+
+from db import pool
+from db.connector import TOPICS_CHANNEL, get_db_connection
+from services.user_cache import user_cache
+from utils import metrics
+
+log = logging.getLogger(__name__)
+
+DIM = 384             # размерность all-MiniLM-L6-v2
+THRESHOLD = 0.45      # косинусная близость новости к теме, с которой тема считается совпавшей
+MAX_TOPICS = 10       # тем на пользователя
+MAX_TOPIC_LENGTH = 100
+MATCH_CHUNK = 256     # новостей в одном матричном произведении: N×T в памяти
+EMBED_BATCH = 500     # тем за один проход воркера
+EMBED_INTERVAL = 10   # секунд между проходами воркера
+
+TOPICS_INDEXED = metrics.gauge("topic_index_topics", "Тем с эмбеддингами в индексе")
+MATCH_SECONDS = metrics.histogram("topic_match_seconds", "Сопоставление пачки новостей с темами")
+TOPICS_EMBEDDED = metrics.counter("topics_embedded_total", "Тем обработано моделью")
+
+
+class TopicIndex:
+    """
+    Смысловые подписки: темы всех пользователей — строки одной матрицы T×DIM
+    нормированных эмбеддингов. Пачка новостей сопоставляется одним
+    произведением E·Vᵀ и порогом THRESHOLD, без запросов к БД.
+
+    Изменение тем пользователя не перестраивает матрицу: его старые строки
+    обнуляются (с нулём совпадения нет), новые дописываются в конец;
+    обнулённые строки вычищаются, когда их становится больше половины.
+
+    Темы пишет save_topics (эмбеддинг NULL), эмбеддинги считает воркер
+    сбора (embed_loop) и сообщает в TOPICS_CHANNEL — процессы бота
+    перечитывают темы одного пользователя.
+
+    Наличие тем индекс сообщает user_cache: пользователь с темами и пустым
+    фильтром перестаёт получать все новости подряд.
+    """
+
+    def __init__(self, dim: int = DIM, threshold: float = THRESHOLD):
+        self.dim = dim
+        self.threshold = threshold
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._owners = np.zeros(0, dtype=np.int64)   # строка → telegram_id, −1 — обнулена
+        self._size = 0
+        self._free = 0
+        self._rows: dict[int, list[int]] = {}        # пользователь → его строки
+        self._texts: dict[int, list[str]] = {}       # пользователь → темы, в том числе без эмбеддинга
+        TOPICS_INDEXED.set_function(lambda: self._size - self._free)
+
+    def topics(self, tg_id: int) -> list[str]:
+        return list(self._texts.get(tg_id, []))
+
+    def match(self, embeddings: np.ndarray) -> list[set[int]]:
+        """Для каждой новости (строки embeddings) — пользователи, чья тема с ней совпала."""
+        result = [set() for _ in range(len(embeddings))]
+        if not self._size or not len(embeddings):
+            return result
+        with MATCH_SECONDS.time():
+            emb = np.asarray(embeddings, dtype=np.float32)
+            emb = emb / np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+            vectors = self._vectors[:self._size]
+            for start in range(0, len(emb), MATCH_CHUNK):
+                hits = emb[start:start + MATCH_CHUNK] @ vectors.T >= self.threshold
+                for i, j in zip(*np.nonzero(hits)):
+                    result[start + i].add(int(self._owners[j]))
+        return result
+
+    # --- загрузка ----------------------------------------------------------
+
+    async def load(self):
+        rows = await pool.fetch(
+            "user_topics_all",
+            "SELECT telegram_id, topic, embedding FROM user_topics ORDER BY telegram_id, id"
+        )
+        self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self._owners = np.zeros(0, dtype=np.int64)
+        self._size = self._free = 0
+        self._rows.clear()
+        self._texts.clear()
+        by_user: dict[int, list] = {}
+        for row in rows:
+            by_user.setdefault(row["telegram_id"], []).append(row)
+        for tg_id, user_rows in by_user.items():
+            self._put(tg_id, user_rows)
+        user_cache.set_topic_users(set(by_user))
+        log.info("Индекс тем: пользователей %d, тем с эмбеддингами %d", len(by_user), self._size)
+
+    async def refresh(self, tg_id: int):
+        rows = await pool.fetch(
+            "user_topics_user",
+            "SELECT telegram_id, topic, embedding FROM user_topics WHERE telegram_id = $1 ORDER BY id",
+            tg_id
+        )
+        self._put(tg_id, rows)
+        user_cache.set_has_topics(tg_id, bool(rows))
+
+    def on_notify(self, channel: str, payload: str):
+        """Обработчик TOPICS_CHANNEL для db.listener.listen."""
+        try:
+            tg_id = int(payload)
+        except ValueError:
+            log.warning("%s: непонятный payload %r", channel, payload)
+            return
+        asyncio.get_running_loop().create_task(self.refresh(tg_id))
+
+    def on_reconnect(self):
+        asyncio.get_running_loop().create_task(self.load())
+
+    # --- запись ------------------------------------------------------------
+
+    async def save_topics(self, tg_id: int, topics: list[str]):
+        """Заменяет темы пользователя; эмбеддинги уже известных тем сохраняются."""
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    "DELETE FROM user_topics WHERE telegram_id = $1 AND topic <> ALL($2::text[])",
+                    tg_id, topics
+                )
+                await conn.execute(
+                    """
+                    INSERT INTO user_topics (telegram_id, topic)
+                    SELECT $1, t FROM unnest($2::text[]) AS t
+                    ON CONFLICT (telegram_id, topic) DO NOTHING
+                    """,
+                    tg_id, topics
+                )
+                await conn.execute("SELECT pg_notify($1, $2)", TOPICS_CHANNEL, str(tg_id))
+        await self.refresh(tg_id)
+
+    async def clear_topics(self, tg_id: int):
+        await self.save_topics(tg_id, [])
+
+    # --- матрица -----------------------------------------------------------
+
+    def _put(self, tg_id: int, rows):
+        for r in self._rows.pop(tg_id, []):
+            self._vectors[r] = 0
+            self._owners[r] = -1
+            self._free += 1
+        self._texts.pop(tg_id, None)
+        if not rows:
+            return
+        self._texts[tg_id] = [row["topic"] for row in rows]
+        vectors = [np.asarray(row["embedding"], dtype=np.float32) for row in rows if row["embedding"] is not None]
+        if vectors:
+            start = self._append(np.stack(vectors), tg_id)
+            self._rows[tg_id] = list(range(start, start + len(vectors)))
+        if self._free > max(1024, self._size // 2):
+            self._compact()
+
+    def _append(self, vectors: np.ndarray, tg_id: int) -> int:
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        need = self._size + len(vectors)
+        if need > len(self._vectors):
+            capacity = max(need, 2 * len(self._vectors), 1024)
+            grown = np.zeros((capacity, self.dim), dtype=np.float32)
+            grown[:self._size] = self._vectors[:self._size]
+            owners = np.full(capacity, -1, dtype=np.int64)
+            owners[:self._size] = self._owners[:self._size]
+            self._vectors, self._owners = grown, owners
+        start = self._size
+        self._vectors[start:need] = vectors
+        self._owners[start:need] = tg_id
+        self._size = need
+        return start
+
+    def _compact(self):
+        keep = np.nonzero(self._owners[:self._size] >= 0)[0]
+        self._vectors = self._vectors[keep].copy()
+        self._owners = self._owners[keep].copy()
+        self._size = len(keep)
+        self._free = 0
+        self._rows.clear()
+        for row, tg_id in enumerate(self._owners):
+            self._rows.setdefault(int(tg_id), []).append(row)
+
+
+def embed_pending(checker, batch: int = EMBED_BATCH) -> int:
+    """
+    Воркер сбора: считает эмбеддинги новых тем моделью дедупликатора
+    (checker.embed_many) и сообщает процессам бота. Возвращает число тем.
+    """
+    conn = get_db_connection()
+    try:
+        register_vector(conn)
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT id, telegram_id, topic FROM user_topics WHERE embedding IS NULL ORDER BY id LIMIT %s",
+                (batch,)
+            )
+            rows = cur.fetchall()
+            if not rows:
+                return 0
+            vectors = checker.embed_many([topic for _, _, topic in rows])
+            execute_values(cur, """
+                UPDATE user_topics AS t SET embedding = v.embedding
+                FROM (VALUES %s) AS v(id, embedding)
+                WHERE t.id = v.id
+            """, [(topic_id, Vector(vec.tolist())) for (topic_id, _, _), vec in zip(rows, vectors)],
+               template="(%s, %s::vector)", page_size=len(rows))
+            cur.execute("SELECT pg_notify(%s, tg::text) FROM unnest(%s::bigint[]) AS tg",
+                        (TOPICS_CHANNEL, sorted({tg_id for _, tg_id, _ in rows})))
+        conn.commit()
+    finally:
+        conn.close()
+    TOPICS_EMBEDDED.inc(len(rows))
+    return len(rows)
+
+
+async def embed_loop(checker, interval: float = EMBED_INTERVAL):
+    """Периодически обрабатывает новые темы (в потоке, чтобы не блокировать loop)."""
+    while True:
+        try:
+            while await asyncio.to_thread(embed_pending, checker) == EMBED_BATCH:
+                pass
+        except Exception:
+            log.exception("Ошибка расчёта эмбеддингов тем")
+        await asyncio.sleep(interval)
+
+
+# Общий индекс процесса бота
+topic_index = TopicIndex()
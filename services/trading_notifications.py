@@ -1,38 +1,29 @@
 from aiogram import Bot
-from db.connector import get_db_connection
+from services.send_engine import Priority, send_engine
+from services.user_cache import user_cache
 
 
 async def send_trading_start(bot: Bot):
-    conn = get_db_connection()
-    try:
-        with conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT telegram_id FROM users")
-                for (tg_id,) in cur.fetchall():
-                    await bot.send_message(
-                        chat_id=tg_id,
-                        text="🔔 *Торги начались!*\n\nСейчас будем присылать *для вас* самые важные и актуальные новости.",
-                        parse_mode="Markdown"
-                    )
-    finally:
-        conn.close()
+    for user in user_cache.all():
+        send_engine.submit(
+            user["telegram_id"],
+            "🔔 *Торги начались!*\n\nСейчас будем присылать *для вас* самые важные и актуальные новости.",
+            priority=Priority.BROADCAST,
+            kind="trading",
+            parse_mode="Markdown"
+        )
 
 
 async def send_trading_end(bot: Bot, additional_message: str = None):
-    conn = get_db_connection()
-    try:
-        with conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT telegram_id FROM users")
-                for (tg_id,) in cur.fetchall():
-                    message = "🔕 *Торги завершены*"
-                    if additional_message:
-                        message += f"\n\n{additional_message}"
+    message = "🔕 *Торги завершены*"
+    if additional_message:
+        message += f"\n\n{additional_message}"
 
-                    await bot.send_message(
-                        chat_id=tg_id,
-                        text=message,
-                        parse_mode="Markdown"
-                    )
-    finally:
-        conn.close()
\ No newline at end of file
+    for user in user_cache.all():
+        send_engine.submit(
+            user["telegram_id"],
+            message,
+            priority=Priority.BROADCAST,
+            kind="trading",
+            parse_mode="Markdown"
+        )
\ No newline at end of file
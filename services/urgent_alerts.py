@@ -0,0 +1,100 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from services.scheduler import TRADING_CLOSE_HOUR, TRADING_OPEN_HOUR, moscow_tz
+from services.send_engine import Priority, send_engine
+from services.user_cache import user_cache
+from utils import metrics
+from utils.message_composer import compose
+
+log = logging.getLogger(__name__)
+
+LOW_INTENSITY = 2    # intensity <= — резко негативное событие
+HIGH_INTENSITY = 9   # intensity >= — резко позитивное
+MAX_AGE = timedelta(minutes=15)  # старые новости (backfill, догоняющий дочит) не срочные
+REMEMBER = 1000      # сколько последних срочных новостей помнить для сверки с рассылкой
+
+TIME_TO_ALERT = metrics.histogram(
+    "alert_time_to_alert_seconds", "От публикации новости до отправки срочного оповещения",
+    ("trader_type",), buckets=(1, 2.5, 5, 10, 20, 30, 60, 120, 300, 900)
+)
+ALERTS = metrics.counter("alerts_total", "Срочные оповещения по исходу", ("result",))
+
+
+def is_urgent(record: dict) -> bool:
+    return record["intensity"] <= LOW_INTENSITY or record["intensity"] >= HIGH_INTENSITY
+
+
+def in_trading_hours(now: datetime | None = None) -> bool:
+    """Будний день, основная сессия по Москве."""
+    now = (now or datetime.now(timezone.utc)).astimezone(moscow_tz)
+    return now.weekday() < 5 and TRADING_OPEN_HOUR <= now.hour < TRADING_CLOSE_HOUR
+
+
+class UrgentAlerts:
+    """
+    Быстрый путь для новостей с экстремальной intensity: оповещение уходит
+    сразу при записи новости, в обход DeliveryScheduler и news_interval,
+    в полосе Priority.ALERT очереди отправки.
+
+    Получатели — подписчики тикеров новости (пользователи без фильтра
+    срочных оповещений не получают). Вне торговых часов новость ждёт
+    обычной рассылки. Кому оповещение ушло, помнится: диспетчер не шлёт
+    ту же новость повторно (was_alerted).
+
+    Подключается как подписчик news_cache: news_cache.listeners.append(urgent_alerts.on_news).
+    """
+
+    def __init__(self, remember: int = REMEMBER):
+        self.remember = remember
+        self._alerted: OrderedDict[int, set[int]] = OrderedDict()  # id новости → кому ушло
+
+    def on_news(self, records: list[dict]):
+        now = datetime.now(timezone.utc)
+        if not in_trading_hours(now):
+            return
+        for record in records:
+            if not is_urgent(record) or now - record["published_time"] > MAX_AGE:
+                continue
+            recipients = user_cache.subscribers(record["tickers"], include_unfiltered=False)
+            if not recipients:
+                continue
+            messages = compose([record["text"]], prefix="🚨 ")
+            if not messages:
+                continue
+            self._remember(record["id"], recipients)
+            for tg_id in recipients:
+                profile = user_cache.get(tg_id)
+                trader_type = profile["trader_type"] if profile and profile["trader_type"] else "unknown"
+                # оповещение доставлено, когда ушли все его части
+                sent = asyncio.gather(*(
+                    send_engine.submit(tg_id, text, priority=Priority.ALERT, kind="alert", parse_mode="HTML")
+                    for text in messages
+                ))
+                sent.add_done_callback(self._observer(record["published_time"], trader_type))
+            log.info("Срочная новость %s: оповещено %d", record["id"], len(recipients))
+
+    @staticmethod
+    def _observer(published_time: datetime, trader_type: str):
+        def observe(future):
+            if future.cancelled() or future.exception() is not None or not all(future.result()):
+                ALERTS.inc(result="failed")
+                return
+            ALERTS.inc(result="sent")
+            TIME_TO_ALERT.observe((datetime.now(timezone.utc) - published_time).total_seconds(),
+                                  trader_type=trader_type)
+        return observe
+
+    def _remember(self, news_id: int, recipients: set[int]):
+        self._alerted[news_id] = recipients
+        while len(self._alerted) > self.remember:
+            self._alerted.popitem(last=False)
+
+    def was_alerted(self, tg_id: int, news_id: int) -> bool:
+        return tg_id in self._alerted.get(news_id, ())
+
+
+# Общий экземпляр процесса бота
+urgent_alerts = UrgentAlerts()
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+
+from db import pool
+from db.connector import USERS_CHANNEL
+from utils import metrics
+
+log = logging.getLogger(__name__)
+
+USERS_CACHED = metrics.gauge("user_cache_users", "Пользователей в кеше профилей")
+CACHE_REFRESHES = metrics.counter("user_cache_refresh_total", "Перечитывания кеша профилей", ("kind",))
+
+_PROFILE_COLUMNS = "telegram_id, filter, noise_tolerance, news_interval, trader_type, style, last_news_id"
+
+
+class UserCache:
+    """
+    Профили пользователей в памяти процесса: рассылка, дайджест и /news
+    не читают users на каждый вызов.
+
+    Запись идёт через save_filter/clear_filter/save_survey: UPSERT в БД,
+    обновление кеша и NOTIFY в USERS_CHANNEL (payload — telegram_id) в той же
+    транзакции. Другие процессы бота слушают канал и перечитывают один профиль.
+
+    Профиль — словарь с ключами telegram_id, filter (список тикеров),
+    noise_tolerance, news_interval, trader_type, style, last_news_id (курсор
+    рассылки, None — ещё ничего не получал). Пустой filter без смысловых
+    тем — все новости; с темами — только совпавшие с ними.
+    """
+
+    def __init__(self):
+        self._users: dict[int, dict] = {}
+        self._by_ticker: dict[str, set[int]] = {}   # тикер → подписчики
+        self._unfiltered: set[int] = set()          # без фильтра и тем: получают всё
+        self._with_topics: set[int] = set()         # есть смысловые темы (ведёт services/topics.py)
+        self.loaded = False
+        USERS_CACHED.set_function(lambda: len(self._users))
+
+    # --- чтение ------------------------------------------------------------
+
+    def get(self, tg_id: int) -> dict | None:
+        return self._users.get(tg_id)
+
+    def all(self) -> list[dict]:
+        return list(self._users.values())
+
+    def subscribers(self, tickers, include_unfiltered: bool = True) -> set[int]:
+        """Кому интересна новость с этими тикерами: подписчики тикеров и пользователи без фильтра."""
+        result = set(self._unfiltered) if include_unfiltered else set()
+        for ticker in tickers:
+            result |= self._by_ticker.get(ticker, set())
+        return result
+
+    # --- загрузка ----------------------------------------------------------
+
+    async def load(self):
+        """Перечитывает всех пользователей; при старте и после переподключения LISTEN."""
+        rows = await pool.fetch("users_profiles", f"SELECT {_PROFILE_COLUMNS} FROM users")
+        self._users.clear()
+        self._by_ticker.clear()
+        self._unfiltered.clear()
+        for row in rows:
+            self._put(row)
+        self.loaded = True
+        CACHE_REFRESHES.inc(kind="full")
+        log.info("Кеш профилей: загружено пользователей %d", len(self._users))
+
+    async def refresh(self, tg_id: int):
+        row = await pool.fetchrow(
+            "users_profile",
+            f"SELECT {_PROFILE_COLUMNS} FROM users WHERE telegram_id = $1",
+            tg_id
+        )
+        if row is None:
+            self._remove(tg_id)
+        else:
+            self._put(row)
+        CACHE_REFRESHES.inc(kind="user")
+
+    def on_notify(self, channel: str, payload: str):
+        """Обработчик для db.listener.listen: профиль изменён другим процессом."""
+        try:
+            tg_id = int(payload)
+        except ValueError:
+            log.warning("%s: непонятный payload %r", channel, payload)
+            return
+        asyncio.get_running_loop().create_task(self.refresh(tg_id))
+
+    def on_reconnect(self):
+        """Пока LISTEN был отключён, уведомления терялись — перечитываем всё."""
+        asyncio.get_running_loop().create_task(self.load())
+
+    def set_topic_users(self, tg_ids: set[int]):
+        """Кто из пользователей подписан на смысловые темы (после полной загрузки тем)."""
+        changed = self._with_topics ^ tg_ids
+        self._with_topics = set(tg_ids)
+        for tg_id in changed:
+            self._classify(tg_id)
+
+    def set_has_topics(self, tg_id: int, has_topics: bool):
+        if has_topics:
+            self._with_topics.add(tg_id)
+        else:
+            self._with_topics.discard(tg_id)
+        self._classify(tg_id)
+
+    def advance_cursor(self, tg_id: int, news_id: int):
+        """Курсор рассылки пишет сам диспетчер (save_cursors) — без NOTIFY."""
+        profile = self._users.get(tg_id)
+        if profile is not None and (profile["last_news_id"] or 0) < news_id:
+            profile["last_news_id"] = news_id
+
+    # --- запись ------------------------------------------------------------
+
+    async def save_filter(self, tg_id: int, tickers: list[str]) -> dict:
+        return await self._write(
+            "user_filter_set",
+            f"""
+            INSERT INTO users (telegram_id, filter)
+            VALUES ($1, $2)
+            ON CONFLICT (telegram_id) DO UPDATE
+              SET filter = EXCLUDED.filter
+            RETURNING {_PROFILE_COLUMNS}
+            """,
+            tg_id, tickers
+        )
+
+    async def clear_filter(self, tg_id: int) -> dict | None:
+        return await self._write(
+            "user_filter_clear",
+            f"""
+            UPDATE users SET filter = ARRAY[]::text[]
+            WHERE telegram_id = $1
+            RETURNING {_PROFILE_COLUMNS}
+            """,
+            tg_id
+        )
+
+    async def save_survey(self, tg_id: int, trader_type: str, news_interval: int) -> dict:
+        return await self._write(
+            "user_survey_upsert",
+            f"""
+            INSERT INTO users (telegram_id, trader_type, news_interval)
+            VALUES ($1, $2, $3)
+            ON CONFLICT (telegram_id) DO UPDATE
+              SET trader_type = EXCLUDED.trader_type,
+                  news_interval = EXCLUDED.news_interval
+            RETURNING {_PROFILE_COLUMNS}
+            """,
+            tg_id, trader_type, news_interval
+        )
+
+    async def _write(self, name: str, query: str, *args) -> dict | None:
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                with pool.QUERY_SECONDS.time(query=name):
+                    row = await conn.fetchrow(query, *args)
+                if row is not None:
+                    # уведомление уходит подписчикам только после commit
+                    await conn.execute("SELECT pg_notify($1, $2)", USERS_CHANNEL, str(row["telegram_id"]))
+        if row is None:
+            return None
+        return self._put(row)
+
+    # --- индексы -----------------------------------------------------------
+
+    def _put(self, row) -> dict:
+        profile = {
+            "telegram_id": row["telegram_id"],
+            "filter": list(row["filter"] or []),
+            "noise_tolerance": row["noise_tolerance"],
+            "news_interval": row["news_interval"],
+            "trader_type": row["trader_type"],
+            "style": row["style"],
+            "last_news_id": row["last_news_id"],
+        }
+        self._remove(profile["telegram_id"])
+        self._users[profile["telegram_id"]] = profile
+        for ticker in profile["filter"]:
+            self._by_ticker.setdefault(ticker, set()).add(profile["telegram_id"])
+        self._classify(profile["telegram_id"])
+        return profile
+
+    def _classify(self, tg_id: int):
+        # пользователь с темами, но без тикеров получает только совпадения по темам
+        profile = self._users.get(tg_id)
+        if profile is not None and not profile["filter"] and tg_id not in self._with_topics:
+            self._unfiltered.add(tg_id)
+        else:
+            self._unfiltered.discard(tg_id)
+
+    def _remove(self, tg_id: int):
+        old = self._users.pop(tg_id, None)
+        if old is None:
+            return
+        self._unfiltered.discard(tg_id)
+        for ticker in old["filter"]:
+            subscribers = self._by_ticker.get(ticker)
+            if subscribers is not None:
+                subscribers.discard(tg_id)
+                if not subscribers:
+                    del self._by_ticker[ticker]
+
+
+# Общий кеш процесса бота
+user_cache = UserCache()
@@ -2,10 +2,21 @@ import asyncio
 import logging
 
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 
 from config import BOT_TOKEN
-from db.connector import engine, metadata
+from db import partitions, pool
+from db.connector import NEWS_CHANNEL, TOPICS_CHANNEL, USERS_CHANNEL
+from db.fsm_storage import create_storage, fsm_cache_middleware
+from db.listener import listen
+from services.news_dispatcher import news_dispatcher_task
+from services.news_cache import news_cache
+from services.bot_runner import run_bot
+from services.scheduler import setup_scheduler
+from services.send_engine import send_engine
+from services.topics import topic_index
+from services.urgent_alerts import urgent_alerts
+from services.user_cache import user_cache
+from utils import metrics
 
 from handlers.start import router as start_router
 from handlers.news import router as news_router
@@ -14,7 +25,8 @@ from handlers.filter_menu import router as filter_router
 logging.basicConfig(level=logging.INFO)
 
 bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
+dp = Dispatcher(storage=create_storage())  # FSM_STORAGE=postgres — общее для реплик
+dp.update.outer_middleware(fsm_cache_middleware)
 
 # регистрируем роутеры
 dp.include_router(start_router)
@@ -23,9 +35,49 @@ dp.include_router(filter_router)
 
 async def main():
     # создаём таблицы при старте
-    metadata.create_all(engine)
+    partitions.prepare_schema()
     logging.info("Таблицы в БД проверены и созданы, запускаю бота")
-    await dp.start_polling(bot)
+    await metrics.start_from_env()
+    await pool.init_pool()
+    await user_cache.load()
+    await topic_index.load()
+    await news_cache.warm()
+    await send_engine.start(bot)
+    # срочные новости уходят сразу, как только попадают в кеш
+    news_cache.listeners.append(urgent_alerts.on_news)
+    # дайджест в 9:00 и оповещения о начале и конце торгов
+    scheduler = setup_scheduler(bot)
+    scheduler.start()
+
+    # новости собирает ingest_worker.py; о каждой новой он сообщает через NOTIFY.
+    # Изменения профилей из других процессов бота приходят в USERS_CHANNEL,
+    # темы и их эмбеддинги (от ingest_worker.py) — в TOPICS_CHANNEL
+    news_ready = asyncio.Event()
+
+    def on_notify(channel, payload):
+        if channel == USERS_CHANNEL:
+            user_cache.on_notify(channel, payload)
+        elif channel == TOPICS_CHANNEL:
+            topic_index.on_notify(channel, payload)
+        else:
+            news_cache.on_notify(channel, payload)
+            news_ready.set()
+
+    def on_connect():
+        # пока не было соединения, уведомления терялись
+        user_cache.on_reconnect()
+        topic_index.on_reconnect()
+        news_cache.on_notify(NEWS_CHANNEL, "")
+
+    asyncio.create_task(listen([NEWS_CHANNEL, USERS_CHANNEL, TOPICS_CHANNEL], on_notify, on_connect=on_connect))
+    asyncio.create_task(news_dispatcher_task(bot, news_ready))
+
+    try:
+        await run_bot(bot, dp)
+    finally:
+        scheduler.shutdown(wait=False)
+        await send_engine.stop()
+        await pool.close_pool()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -1,4 +1,5 @@
 from aiogram.fsm.state import StatesGroup, State
 
 class FilterStates(StatesGroup):
-    waiting_for_tickers = State()
\ No newline at end of file
+    waiting_for_tickers = State()
+    waiting_for_topics = State()
\ No newline at end of file
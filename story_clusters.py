@@ -0,0 +1,112 @@
+import numpy as np
+
+
+class StoryClusterIndex:
+    """
+    Инкрементальная кластеризация новостей одного тикера в «сюжеты».
+    Для каждого сюжета хранится бегущая сумма эмбеддингов (центроид)
+    и объединение MinHash-подписей (поэлементный минимум хешей).
+    Новая новость сравнивается сначала с центроидами сюжетов, и только
+    потом — с отдельными новостями внутри подходящих сюжетов.
+    """
+
+    def __init__(self,
+                 dim: int,
+                 n_perm: int,
+                 threshold_cosine: float = 0.6,   # cosine к центроиду, чтобы примкнуть к сюжету
+                 threshold_jaccard: float = 0.1,  # Jaccard к объединению MinHash для кандидата
+                 top_k: int = 3                   # сколько ближайших сюжетов проверять всегда
+                 ):
+        self.dim = dim
+        self.n_perm = n_perm
+        self.threshold_c = threshold_cosine
+        self.threshold_j = threshold_jaccard
+        self.top_k = top_k
+
+        self.size = 0
+        self.sums = np.zeros((0, dim), dtype=np.float32)         # сумма эмбеддингов участников
+        self.centroids = np.zeros((0, dim), dtype=np.float32)    # нормированные sums
+        self.unions = np.zeros((0, n_perm), dtype=np.uint64)     # MinHash объединения
+        self.reports = np.zeros(0, dtype=np.int64)               # сколько раз сюжет встречался
+        self.members: list[list[int]] = []
+        self.item_cluster: dict[int, int] = {}
+
+    def _grow(self):
+        cap = max(8, len(self.sums) * 2)
+        for name, fill in (('sums', 0), ('centroids', 0), ('unions', np.iinfo(np.uint64).max),
+                           ('reports', 0)):
+            old = getattr(self, name)
+            new = np.full((cap,) + old.shape[1:], fill, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def candidates(self, vec: np.ndarray, hashvalues: np.ndarray) -> list[int]:
+        """
+        Сюжеты, с участниками которых стоит сравнить новость:
+        top_k ближайших по центроиду плюс все с Jaccard к объединению ≥ порога.
+        Стоимость — O(число сюжетов), а не O(число новостей).
+        """
+        if not self.size:
+            return []
+        cos = self.centroids[:self.size] @ vec
+        k = min(self.top_k, self.size)
+        best = np.argpartition(-cos, k - 1)[:k]
+        jac = (self.unions[:self.size] == hashvalues).mean(axis=1)
+        lexical = np.flatnonzero(jac >= self.threshold_j)
+        found = np.union1d(best, lexical)
+        return found[np.argsort(-cos[found])].tolist()
+
+    def add(self, key: int, vec: np.ndarray, hashvalues: np.ndarray) -> int:
+        """Присоединяет новость к ближайшему сюжету или открывает новый. Возвращает id сюжета."""
+        cid = None
+        if self.size:
+            cos = self.centroids[:self.size] @ vec
+            best = int(np.argmax(cos))
+            if cos[best] >= self.threshold_c:
+                cid = best
+
+        if cid is None:
+            if self.size == len(self.sums):
+                self._grow()
+            cid = self.size
+            self.size += 1
+            self.members.append([])
+
+        self.sums[cid] += vec
+        self.centroids[cid] = self.sums[cid] / np.linalg.norm(self.sums[cid])
+        np.minimum(self.unions[cid], hashvalues, out=self.unions[cid])
+        self.reports[cid] += 1
+        self.members[cid].append(key)
+        self.item_cluster[key] = cid
+        return cid
+
+    def report(self, key: int):
+        """Учитывает дубликат новости key как ещё один источник её сюжета."""
+        self.reports[self.item_cluster[key]] += 1
+
+    def cluster_of(self, key: int) -> int:
+        return self.item_cluster[key]
+
+    def sources(self, cid: int) -> int:
+        """Сколько раз (из скольких источников) встречался сюжет."""
+        return int(self.reports[cid])
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        """Состояние для снимка: всё, кроме состава сюжетов, восстанавливаемого по item_cluster."""
+        return {
+            'sums': self.sums[:self.size],
+            'unions': self.unions[:self.size],
+            'reports': self.reports[:self.size],
+        }
+
+    def load_arrays(self, arrays, item_cluster: dict[int, int]):
+        self.size = len(arrays['reports'])
+        self.sums = np.array(arrays['sums'], dtype=np.float32)
+        norms = np.linalg.norm(self.sums, axis=1, keepdims=True)
+        self.centroids = self.sums / np.where(norms == 0, 1, norms)
+        self.unions = np.array(arrays['unions'], dtype=np.uint64)
+        self.reports = np.array(arrays['reports'], dtype=np.int64)
+        self.members = [[] for _ in range(self.size)]
+        self.item_cluster = dict(item_cluster)
+        for key, cid in sorted(self.item_cluster.items()):
+            self.members[cid].append(key)
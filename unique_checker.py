@@ -1,8 +1,14 @@
-from datasketch import MinHash, MinHashLSH
+import json
+import os
+from pathlib import Path
+
+from datasketch import MinHash, MinHashLSH, LeanMinHash
 from sentence_transformers import SentenceTransformer
 import numpy as np
 from annoy import AnnoyIndex
 
+from story_clusters import StoryClusterIndex
+
 class NewsDeduplicator:
     def __init__(self,
                  ticker_list: list[str],      # список тикеров для предсоздания индексов; новые тикеры будут добавляться автоматически
@@ -13,7 +19,10 @@ class NewsDeduplicator:
                  threshold_cosine: float = 0.4,       # минимальный cosine similarity для отметки «дубликат» при AND-проверке
                  alpha: float = 0.5,           # вес cosine в комбинированном скоре: score = α·cosine + (1–α)·jaccard
                  annoy_trees: int = 30,        # число деревьев в Annoy-индексе; больше → точнее поиск, но дольше билд
-                 sentiment_diff_thresh: int = 2  # допустимая разница интенсивности тональности (1–10); выше → менее строгая фильтрация по настроению
+                 sentiment_diff_thresh: int = 2,  # допустимая разница интенсивности тональности (1–10); выше → менее строгая фильтрация по настроению
+                 use_stories: bool = True,     # искать дубликаты через центроиды сюжетов вместо Annoy по всей истории
+                 story_threshold: float = 0.6,  # cosine к центроиду сюжета, чтобы новость примкнула к нему
+                 story_top_k: int = 3          # сколько ближайших сюжетов проверять поэлементно
                  ):
         # Параметры MinHash + LSH
         self.n_perm = n_perm
@@ -21,6 +30,7 @@ class NewsDeduplicator:
         self.threshold_j = threshold_jaccard
 
         # Параметры эмбеддингов и Annoy (Bi-Encoder)
+        self.emb_model = emb_model
         self.model = SentenceTransformer(emb_model)
         self.emb_dim = self.model.get_sentence_embedding_dimension()
         self.threshold_c = threshold_cosine
@@ -30,6 +40,11 @@ class NewsDeduplicator:
         # Параметр фильтрации по разнице тональности
         self.sentiment_diff_thresh = sentiment_diff_thresh
 
+        # Параметры кластеризации по сюжетам
+        self.use_stories = use_stories
+        self.story_threshold = story_threshold
+        self.story_top_k = story_top_k
+
         # Инициализация по-тикерных индексов
         # Структура для каждого тикера:
         # {
@@ -37,12 +52,19 @@ class NewsDeduplicator:
         #   'annoy': AnnoyIndex(...),
         #   'id_to_text': {},
         #   'id_to_sentiment': {},  # polarity + intensity
+        #   'id_to_vec': {},        # key → нормированный embedding
+        #   'id_to_minhash': {},    # key → MinHash
+        #   'stories': StoryClusterIndex(...),
         #   'next_id': 0
         # }
         self.ticker_indices: dict[str, dict] = {}
         for t in ticker_list:
             self._init_indices_for_ticker(t)
 
+        # Тикеры из снимка, которые ещё не подгружены в память (см. load)
+        self._snapshot_root: Path | None = None
+        self._snapshot_tickers: set[str] = set()
+
         # Хранилище окончательно добавленных уникальных новостей
         self.unique_news: list[dict] = []
 
@@ -53,9 +75,25 @@ class NewsDeduplicator:
             'annoy': AnnoyIndex(self.emb_dim, 'angular'),
             'id_to_text': {},
             'id_to_sentiment': {},  # key → (polarity, intensity)
+            'id_to_vec': {},
+            'id_to_minhash': {},
+            'annoy_dirty': False,
+            'stories': StoryClusterIndex(self.emb_dim, self.n_perm,
+                                         threshold_cosine=self.story_threshold,
+                                         threshold_jaccard=self.threshold_j,
+                                         top_k=self.story_top_k),
             'next_id': 0
         }
 
+    def _index(self, ticker: str) -> dict:
+        """Возвращает индексы тикера: из памяти, лениво из снимка или пустые."""
+        if ticker not in self.ticker_indices:
+            if ticker in self._snapshot_tickers:
+                self._load_ticker(ticker)
+            else:
+                self._init_indices_for_ticker(ticker)
+        return self.ticker_indices[ticker]
+
     def _minhash(self, text: str) -> MinHash:
         """Строит MinHash-подпись по шинглам заданного размера."""
         m = MinHash(num_perm=self.n_perm)
@@ -70,29 +108,41 @@ class NewsDeduplicator:
         vec = self.model.encode([text], convert_to_numpy=True)
         return vec / np.linalg.norm(vec, axis=1, keepdims=True)
 
-    def _is_duplicate_for_ticker(self,
-                                 text: str,
-                                 ticker: str,
-                                 new_pol: str,
-                                 new_int: int) -> bool:
+    def _find_duplicate_for_ticker(self,
+                                   ticker: str,
+                                   new_pol: str,
+                                   new_int: int,
+                                   m_new: MinHash,
+                                   vec_new: np.ndarray) -> int | None:
         """
-        Проверяет, является ли текст дубликатом внутри данного тикера.
+        Ищет дубликат внутри данного тикера и возвращает его key (или None).
         Сначала фильтр по тональности (polarity+intensity), затем по Jaccard и Cosine.
+        С use_stories кандидаты — участники ближайших сюжетов и MinHashLSH,
+        без сюжетов — MinHashLSH и Annoy, как раньше.
         """
-        idx = self.ticker_indices[ticker]
+        idx = self._index(ticker)
         if idx['next_id'] == 0:
-            return False
+            return None
+
+        if self.use_stories:
+            # кандидаты по сюжетам: сначала центроиды, потом их участники
+            cand_story = [key
+                          for story in idx['stories'].candidates(vec_new, m_new.hashvalues)
+                          for key in idx['stories'].members[story]]
+        else:
+            cand_story = []
 
         # кандидаты по MinHashLSH
-        m_new = self._minhash(text)
         cand_lsh = idx['lsh'].query(m_new)
 
-        # кандидаты по Annoy (Bi-Encoder)
-        vec_new = self._embed(text)[0]
-        cand_annoy = idx['annoy'].get_nns_by_vector(vec_new, 20)
+        # кандидаты по Annoy (Bi-Encoder) — только без сюжетов, т.к. требуют пересборки
+        cand_annoy = [] if self.use_stories else self._annoy(idx).get_nns_by_vector(vec_new, 20)
 
-        for cid in set(cand_lsh) | set(cand_annoy):
-            old = idx['id_to_text'][cid]
+        seen = set()
+        for cid in cand_story + list(cand_lsh) + cand_annoy:
+            if cid in seen:
+                continue
+            seen.add(cid)
             old_pol, old_int = idx['id_to_sentiment'][cid]
 
             # жесткая фильтрация по тональности
@@ -100,45 +150,66 @@ class NewsDeduplicator:
                 continue
 
             # вычисляем метрики
-            j = m_new.jaccard(self._minhash(old))
-            vec_old = self._embed(old)[0]
+            j = m_new.jaccard(idx['id_to_minhash'][cid])
+            vec_old = idx['id_to_vec'][cid]
             c = float(np.dot(vec_new, vec_old))
             score = self.alpha * c + (1 - self.alpha) * j
 
             # AND-логика: обе метрики должны быть ≥ своих порогов
             if j >= self.threshold_j and c >= self.threshold_c:
-                return True
+                return cid
             # или комбинированный скор:
             #if score >= max(self.threshold_j, self.threshold_c):
-             #   return True
+             #   return cid
 
-        return False
+        return None
+
+    def _is_duplicate_for_ticker(self,
+                                 text: str,
+                                 ticker: str,
+                                 new_pol: str,
+                                 new_int: int) -> bool:
+        """Проверяет, является ли текст дубликатом внутри данного тикера."""
+        m_new = self._minhash(text)
+        vec_new = self._embed(text)[0]
+        return self._find_duplicate_for_ticker(ticker, new_pol, new_int, m_new, vec_new) is not None
+
+    def _annoy(self, idx: dict) -> AnnoyIndex:
+        """Annoy-индекс тикера; пересобирается лениво, только если устарел."""
+        if idx['annoy_dirty']:
+            new_annoy = AnnoyIndex(self.emb_dim, 'angular')
+            for k, vec in idx['id_to_vec'].items():
+                new_annoy.add_item(k, vec)
+            new_annoy.build(self.annoy_trees)
+            idx['annoy'] = new_annoy
+            idx['annoy_dirty'] = False
+        return idx['annoy']
 
     def _add_to_indices_for_ticker(self,
                                    text: str,
                                    ticker: str,
                                    pol: str,
-                                   intensity: int):
+                                   intensity: int,
+                                   m: MinHash,
+                                   vec: np.ndarray) -> int:
         """
-        Добавляет текст, его тональность и векторы в LSH и Annoy индексы для тикера.
-        Перестраивает Annoy с нуля для корректности.
+        Добавляет текст, его тональность и векторы в LSH-индекс и сюжеты тикера.
+        Annoy помечается устаревшим и пересобирается при следующем запросе.
+        Возвращает id сюжета, к которому отнесена новость.
         """
-        idx = self.ticker_indices[ticker]
+        idx = self._index(ticker)
         key = idx['next_id']
         idx['id_to_text'][key] = text
         idx['id_to_sentiment'][key] = (pol, intensity)
+        idx['id_to_vec'][key] = vec
+        idx['id_to_minhash'][key] = m
         idx['next_id'] += 1
 
         # LSH вставка
-        idx['lsh'].insert(key, self._minhash(text))
+        idx['lsh'].insert(key, m)
+        idx['annoy_dirty'] = True
 
-        # пересборка Annoy
-        new_annoy = AnnoyIndex(self.emb_dim, 'angular')
-        for k, txt in idx['id_to_text'].items():
-            vec = self._embed(txt)[0]
-            new_annoy.add_item(k, vec)
-        new_annoy.build(self.annoy_trees)
-        idx['annoy'] = new_annoy
+        return idx['stories'].add(key, vec, m.hashvalues)
 
     def add_news(self,
                  text: str,
@@ -150,27 +221,172 @@ class NewsDeduplicator:
         Принимает текст, список тикеров, а также заранее вычисленные
         polarity ('POSITIVE'/'NEGATIVE'/'NEUTRAL') и intensity (1–10).
         Возвращает True, если новость уникальна хотя бы для одного тикера,
-        False — если дубликат для всех.
+        False — если дубликат для всех. Дубликат засчитывается
+        как ещё один источник сюжета найденной новости.
         """
+        m_new = self._minhash(text)
+        vec_new = self._embed(text)[0]
+
         unique_tickers = []
         for t in tickers:
-            if t not in self.ticker_indices:
-                self._init_indices_for_ticker(t)
-            if not self._is_duplicate_for_ticker(text, t, polarity, intensity):
+            dup = self._find_duplicate_for_ticker(t, polarity, intensity, m_new, vec_new)
+            if dup is None:
                 unique_tickers.append(t)
+            else:
+                self.ticker_indices[t]['stories'].report(dup)
 
         if not unique_tickers:
             return False
 
+        stories = {}
         for t in unique_tickers:
-            self._add_to_indices_for_ticker(text, t, polarity, intensity)
+            stories[t] = self._add_to_indices_for_ticker(text, t, polarity, intensity, m_new, vec_new)
 
         self.unique_news.append({
             'text': text,
-            'tickers': unique_tickers
+            'tickers': unique_tickers,
+            'stories': stories
         })
         return True
 
+    def get_stories(self, ticker: str) -> list[dict]:
+        """
+        Сюжеты тикера, от самых массовых: {'text': первая новость сюжета,
+        'sources': сколько раз сюжет встречался, 'size': сколько уникальных новостей в нём}.
+        """
+        idx = self._index(ticker)
+        st = idx['stories']
+        result = [
+            {
+                'text': idx['id_to_text'][st.members[cid][0]],
+                'sources': st.sources(cid),
+                'size': len(st.members[cid]),
+            }
+            for cid in range(st.size)
+        ]
+        result.sort(key=lambda r: r['sources'], reverse=True)
+        return result
+
     def get_unique(self) -> list[dict]:
         """Возвращает список словарей {'text': ..., 'tickers': ...} для всех уникальных новостей."""
-        return self.unique_news
\ No newline at end of file
+        return self.unique_news
+
+    # --- Снимок состояния ---------------------------------------------------
+    # Структура каталога:
+    #   manifest.json         — параметры, список тикеров, unique_news
+    #   <ticker>/emb.npy      — float32 (N, emb_dim), открывается через mmap
+    #   <ticker>/minhash.npy  — uint64 (N, n_perm), из него пересобирается LSH
+    #   <ticker>/meta.json    — колонки keys/text/polarity/intensity/story
+    #   <ticker>/stories.npz  — суммы эмбеддингов, MinHash-объединения и счётчики сюжетов
+    #   <ticker>/annoy.ann    — Annoy-индекс, грузится через mmap
+
+    def save(self, path: str | os.PathLike):
+        """Сохраняет индексы всех тикеров в каталог path."""
+        root = Path(path)
+        root.mkdir(parents=True, exist_ok=True)
+        for t in list(self._snapshot_tickers):
+            self._index(t)
+
+        for ticker, idx in self.ticker_indices.items():
+            self._save_ticker(root / ticker, idx)
+
+        manifest = {
+            'params': {
+                'n_perm': self.n_perm,
+                'shingle_size': self.shingle_size,
+                'emb_model': self.emb_model,
+                'threshold_jaccard': self.threshold_j,
+                'threshold_cosine': self.threshold_c,
+                'alpha': self.alpha,
+                'annoy_trees': self.annoy_trees,
+                'sentiment_diff_thresh': self.sentiment_diff_thresh,
+                'use_stories': self.use_stories,
+                'story_threshold': self.story_threshold,
+                'story_top_k': self.story_top_k,
+            },
+            'tickers': sorted(self.ticker_indices),
+            'unique_news': self.unique_news,
+        }
+        _atomic_write(root / 'manifest.json',
+                      lambda f: f.write(json.dumps(manifest, ensure_ascii=False).encode('utf-8')))
+
+    def _save_ticker(self, folder: Path, idx: dict):
+        folder.mkdir(parents=True, exist_ok=True)
+        keys = sorted(idx['id_to_text'])
+        emb = np.zeros((len(keys), self.emb_dim), dtype=np.float32)
+        mh = np.zeros((len(keys), self.n_perm), dtype=np.uint64)
+        for row, k in enumerate(keys):
+            emb[row] = idx['id_to_vec'][k]
+            mh[row] = idx['id_to_minhash'][k].hashvalues
+
+        meta = {
+            'next_id': idx['next_id'],
+            'keys': keys,
+            'text': [idx['id_to_text'][k] for k in keys],
+            'polarity': [idx['id_to_sentiment'][k][0] for k in keys],
+            'intensity': [idx['id_to_sentiment'][k][1] for k in keys],
+            'story': [idx['stories'].cluster_of(k) for k in keys],
+        }
+        # запись через временный файл: старые mmap-страницы остаются валидными
+        _atomic_write(folder / 'emb.npy', lambda f: np.save(f, emb))
+        _atomic_write(folder / 'minhash.npy', lambda f: np.save(f, mh))
+        _atomic_write(folder / 'meta.json',
+                      lambda f: f.write(json.dumps(meta, ensure_ascii=False).encode('utf-8')))
+        _atomic_write(folder / 'stories.npz', lambda f: np.savez(f, **idx['stories'].to_arrays()))
+        if keys:
+            tmp = folder / 'annoy.ann.tmp'
+            self._annoy(idx).save(str(tmp))
+            os.replace(tmp, folder / 'annoy.ann')
+
+    @classmethod
+    def load(cls, path: str | os.PathLike, ticker_list: list[str] = (), **kwargs) -> 'NewsDeduplicator':
+        """
+        Восстанавливает дедупликатор из снимка. Читается только manifest.json;
+        индексы тикера подгружаются при первом обращении к нему.
+        kwargs переопределяют сохранённые параметры (кроме n_perm и emb_model).
+        """
+        root = Path(path)
+        manifest = json.loads((root / 'manifest.json').read_text(encoding='utf-8'))
+        params = {**manifest['params'], **kwargs}
+        params['n_perm'] = manifest['params']['n_perm']
+        params['emb_model'] = manifest['params']['emb_model']
+
+        checker = cls([], **params)
+        checker._snapshot_root = root
+        checker._snapshot_tickers = set(manifest['tickers'])
+        checker.unique_news = manifest['unique_news']
+        for t in ticker_list:
+            checker._index(t)
+        return checker
+
+    def _load_ticker(self, ticker: str):
+        folder = self._snapshot_root / ticker
+        self._snapshot_tickers.discard(ticker)
+        self._init_indices_for_ticker(ticker)
+        idx = self.ticker_indices[ticker]
+
+        meta = json.loads((folder / 'meta.json').read_text(encoding='utf-8'))
+        emb = np.load(folder / 'emb.npy', mmap_mode='r')
+        mh = np.load(folder / 'minhash.npy', mmap_mode='r')
+
+        idx['next_id'] = meta['next_id']
+        for row, k in enumerate(meta['keys']):
+            m = LeanMinHash(seed=1, hashvalues=mh[row])
+            idx['id_to_text'][k] = meta['text'][row]
+            idx['id_to_sentiment'][k] = (meta['polarity'][row], meta['intensity'][row])
+            idx['id_to_vec'][k] = emb[row]
+            idx['id_to_minhash'][k] = m
+            idx['lsh'].insert(k, m)
+
+        with np.load(folder / 'stories.npz') as arrays:
+            idx['stories'].load_arrays(arrays, dict(zip(meta['keys'], meta['story'])))
+
+        if meta['keys']:
+            idx['annoy'].load(str(folder / 'annoy.ann'))
+
+
+def _atomic_write(path: Path, write):
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'wb') as f:
+        write(f)
+    os.replace(tmp, path)
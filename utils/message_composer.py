@@ -0,0 +1,70 @@
+import html
+
+MAX_LENGTH = 4096  # лимит Telegram на текст сообщения
+
+
+def text_length(text: str) -> int:
+    """Длина так, как её считает Telegram: в UTF-16 (эмодзи — две единицы)."""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def escape(text: str) -> str:
+    """Экранирует текст новости для parse_mode="HTML"."""
+    return html.escape(text, quote=False)
+
+
+def _split_long(text: str, room: int) -> list[str]:
+    """
+    Режет слишком длинный текст на куски, которые после экранирования
+    помещаются в room. Режем исходный текст, а не HTML, поэтому сущность
+    вроде &amp; никогда не разрывается; по возможности — по пробелу.
+    """
+    parts = []
+    while text_length(escape(text)) > room:
+        cut = room
+        while (excess := text_length(escape(text[:cut])) - room) > 0:
+            # экранирование удлиняет символ не больше чем в 5 раз (& → &amp;)
+            cut -= max(1, excess // 5)
+        space = max(text.rfind(" ", 0, cut), text.rfind("\n", 0, cut))
+        if space > cut // 2:
+            cut = space
+        parts.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    if text:
+        parts.append(text)
+    return parts
+
+
+def compose(texts: list[str], prefix: str = "", header: str = "", footer: str = "",
+            separator: str = "\n\n", limit: int = MAX_LENGTH) -> list[str]:
+    """
+    Упаковывает новости в как можно меньше сообщений для parse_mode="HTML".
+
+    texts — исходные тексты (экранируются здесь), prefix ставится перед каждым.
+    header и footer — уже готовый HTML: header открывает первое сообщение,
+    footer закрывает последнее. Сообщения режутся только между новостями;
+    новость длиннее лимита делится на части сама по себе.
+    """
+    fragments = []
+    for text in texts:
+        room = limit - text_length(prefix) - text_length(header) - text_length(separator)
+        for part in _split_long(text, room):
+            fragments.append(prefix + escape(part))
+
+    messages = []
+    current = header
+    for fragment in fragments:
+        candidate = f"{current}{separator}{fragment}" if current else fragment
+        if text_length(candidate) > limit:
+            messages.append(current)
+            candidate = fragment
+        current = candidate
+    if footer:
+        candidate = f"{current}{separator}{footer}" if current else footer
+        if text_length(candidate) > limit:
+            messages.append(current)
+            candidate = footer
+        current = candidate
+    if current:
+        messages.append(current)
+    return messages
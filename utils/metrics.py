@@ -0,0 +1,287 @@
+import asyncio
+import contextlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+
+log = logging.getLogger(__name__)
+
+# Границы бакетов гистограмм латентности, секунды
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registry: dict[str, "_Metric"] = {}
+_registry_lock = threading.Lock()
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: dict[tuple, object] = {}
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: ожидались метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _fmt_labels(self, key: tuple, extra: dict | None = None) -> str:
+        pairs = list(zip(self.labelnames, key)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        body = ",".join(f'{n}="{_escape(v)}"' for n, v in pairs)
+        return "{" + body + "}"
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{self._fmt_labels(key)} {value}")
+        return lines
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {",".join(k) or "total": v for k, v in self._values.items()}
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, doc, labelnames=()):
+        super().__init__(name, doc, labelnames)
+        self._callbacks: list[Callable[[], dict[tuple, float]]] = []
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, func: Callable[[], dict[tuple, float] | float]):
+        """
+        Значение вычисляется при каждом экспорте: func() возвращает число
+        (для гейджа без меток) или словарь {кортеж меток: значение}.
+        """
+        self._callbacks.append(func)
+
+    def _collect(self) -> dict[tuple, float]:
+        with self._lock:
+            values = dict(self._values)
+        for func in self._callbacks:
+            result = func()
+            if isinstance(result, dict):
+                values.update({tuple(str(v) for v in k): val for k, val in result.items()})
+            else:
+                values[()] = result
+        return values
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for key, value in sorted(self._collect().items()):
+            lines.append(f"{self.name}{self._fmt_labels(key)} {value}")
+        return lines
+
+    def summary(self) -> dict:
+        return {",".join(k) or "value": v for k, v in self._collect().items()}
+
+
+class _Timer(contextlib.ContextDecorator):
+    def __init__(self, histogram: "Histogram", labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def _recreate_cm(self):
+        # декоратор вызывается из разных потоков одновременно: на каждый вызов свой замер
+        return _Timer(self.histogram, self.labels)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, doc, labelnames=(), buckets=BUCKETS):
+        super().__init__(name, doc, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            i = 0
+            while i < len(self.buckets) and value > self.buckets[i]:
+                i += 1
+            state["counts"][i] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def time(self, **labels) -> _Timer:
+        """Замер длительности: `with HIST.time(stage="x"):` или декоратор `@HIST.time()`."""
+        return _Timer(self, labels)
+
+    def quantile(self, q: float, **labels) -> float:
+        """Оценка квантиля по бакетам (линейная интерполяция внутри бакета)."""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            if not state:
+                return math.nan
+            return self._quantile(state, q)
+
+    def _quantile(self, state: dict, q: float) -> float:
+        rank = q * state["count"]
+        seen = 0
+        lower = 0.0
+        for i, count in enumerate(state["counts"]):
+            upper = self.buckets[i] if i < len(self.buckets) else lower
+            if count and seen + count >= rank:
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = upper
+        return lower
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, state["counts"]):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{self._fmt_labels(key, {'le': bound})} {cumulative}")
+                lines.append(f"{self.name}_bucket{self._fmt_labels(key, {'le': '+Inf'})} {state['count']}")
+                lines.append(f"{self.name}_sum{self._fmt_labels(key)} {state['sum']}")
+                lines.append(f"{self.name}_count{self._fmt_labels(key)} {state['count']}")
+        return lines
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                ",".join(key) or "all": {
+                    "count": state["count"],
+                    "avg": round(state["sum"] / state["count"], 6) if state["count"] else None,
+                    "p50": round(self._quantile(state, 0.5), 6),
+                    "p99": round(self._quantile(state, 0.99), 6),
+                }
+                for key, state in self._values.items()
+            }
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _get_or_create(cls, name, doc, labelnames, **kwargs):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, doc, labelnames, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Метрика {name} уже зарегистрирована как {metric.kind}")
+        return metric
+
+
+def counter(name: str, doc: str, labelnames: tuple[str, ...] = ()) -> Counter:
+    return _get_or_create(Counter, name, doc, labelnames)
+
+
+def gauge(name: str, doc: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+    return _get_or_create(Gauge, name, doc, labelnames)
+
+
+def histogram(name: str, doc: str, labelnames: tuple[str, ...] = (), buckets=BUCKETS) -> Histogram:
+    return _get_or_create(Histogram, name, doc, labelnames, buckets=buckets)
+
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def summary() -> dict:
+    """Снимок метрик для структурированного лога."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    return {m.name: m.summary() for m in metrics}
+
+
+def write_textfile(path: str | os.PathLike):
+    """Пишет метрики в файл для node_exporter textfile collector (атомарно)."""
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(render(), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+async def report_loop(interval: float = 60, textfile: str | None = None):
+    """Периодически пишет сводку метрик в лог одной JSON-строкой и, если задано, в textfile."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            log.info("metrics %s", json.dumps(summary(), ensure_ascii=False, default=str))
+            if textfile:
+                write_textfile(textfile)
+        except Exception:
+            log.exception("Не удалось выгрузить метрики")
+
+
+async def start_http_server(host: str = "0.0.0.0", port: int = 9100):
+    """Поднимает aiohttp-эндпоинт /metrics. Возвращает runner для остановки."""
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    log.info("Метрики доступны на http://%s:%d/metrics", host, port)
+    return runner
+
+
+async def start_from_env():
+    """
+    Запускает экспорт метрик по переменным окружения:
+    METRICS_PORT — HTTP-эндпоинт, METRICS_FILE — textfile,
+    METRICS_LOG_INTERVAL — период сводки в лог (по умолчанию 60 с).
+    """
+    port = os.getenv("METRICS_PORT")
+    if port:
+        await start_http_server(port=int(port))
+    interval = float(os.getenv("METRICS_LOG_INTERVAL", "60"))
+    asyncio.create_task(report_loop(interval, os.getenv("METRICS_FILE")))